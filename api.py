@@ -3,27 +3,30 @@ import logging
 import os
 import time
 
-from flask import Flask, make_response, request
+from flask import Flask, jsonify, make_response, request
 from telebot.types import Update
 
 from bot import bot
-from config import config
 from database import db
+from dispatcher import dispatcher
 from logging_conf import configure_logging
 from markups import menu_markup
-from utils import process_inline_button, send_message
+from metrics import metrics
+from utils import (
+    process_inline_button,
+    send_bets_page,
+    send_leaderboard,
+    send_message,
+)
 
 configure_logging()
 logger = logging.getLogger("chatbot.api")
 
 app = Flask(__name__)
 
-db.connect()
-
-bot.remove_webhook()
-time.sleep(1)
-bot.set_webhook(url=config.URL_BOT)
-logger.info(f"webhook set in {config.URL_BOT}")
+# El esquema y el webhook se preparan una vez por despliegue con init.py
+started_at = time.perf_counter()
+first_request_done = False
 
 save_path = "images/"
 if not os.path.exists(save_path):
@@ -37,14 +40,40 @@ Elige una opción para empezar:"""
 @app.route("/", methods=["POST"])
 def webhook():
     if request.headers.get("content-type") == "application/json":
-        json_body = request.get_data()
-        update = Update.de_json(json_body.decode("utf-8"))
-        bot.process_new_updates([update])
+        try:
+            update = Update.de_json(request.get_data().decode("utf-8"))
+        except ValueError:
+            return make_response("Invalid update", 400)
+        # Se procesa en segundo plano: Telegram recibe el 200 sin esperar
+        if not dispatcher.submit(update):
+            return make_response("Busy", 503)
         return make_response("OK", 200)
 
     return make_response("Invalid content-type", 400)
 
 
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    return jsonify(metrics.snapshot())
+
+
+@app.before_request
+def check_schema():
+    global first_request_done
+    if first_request_done:
+        return
+    db.check_schema()
+    first_request_done = True
+    elapsed = time.perf_counter() - started_at
+    metrics.observe("api.time_to_first_request", elapsed)
+    logger.info(f"Primer request a los {elapsed:.3f}s de iniciar el worker")
+
+
+@app.teardown_request
+def remove_session(exc):
+    db.remove_session()
+
+
 @bot.message_handler(commands=["start"])
 def cmd_start(message):
     logger.info("/start")
@@ -57,6 +86,9 @@ def cmd_start(message):
             "last_name": message.from_user.last_name,
         }
         db.create_user(data)
+    elif user["bot_blocked_at"]:
+        # Volvió a abrir el chat: de nuevo recibe difusiones
+        db.update_user(message.from_user.id, {"bot_blocked_at": None})
 
     msg = f"¡Hola {message.from_user.first_name}! 👋" + welcome_msg
     send_message(message, msg, menu_markup())
@@ -83,18 +115,13 @@ def cmd_apostar(message):
 @bot.message_handler(commands=["apuestasactivas"])
 def cmd_apuestasactivas(message):
     logger.info("/apuestasactivas")
-    bets = db.get_user_bets(message.from_user.id, "pending")
-    send_message(message, f"Sus apuestas activas son: {bets}")
+    send_bets_page(message, message.from_user.id, "activas")
 
 
 @bot.message_handler(commands=["apuestaspasadas"])
 def cmd_apuestaspasadas(message):
     logger.info("/apuestaspasadas")
-    bets_win = db.get_user_bets(message.from_user.id, "win")
-    bets_lose = db.get_user_bets(message.from_user.id, "lose")
-    send_message(
-        message, f"Apuestas ganadas: {bets_win}\nApuestas perdidas: {bets_lose}"
-    )
+    send_bets_page(message, message.from_user.id, "pasadas")
 
 
 @bot.message_handler(commands=["recargar"])
@@ -108,9 +135,7 @@ def cmd_recargar(message):
 @bot.message_handler(commands=["top"])
 def cmd_top(message):
     logger.info("/top")
-    send_message(
-        message, "Hola, bienvenido al mejor bot de apuestas deportivas de Cuba!"
-    )
+    send_leaderboard(message)
 
 
 @bot.message_handler(commands=["misreferidos"])
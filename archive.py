@@ -0,0 +1,38 @@
+# Crea las particiones de los próximos meses, archiva apuestas y transacciones
+# ya liquidadas y purga los update_id viejos y las estadísticas de días y
+# semanas ya cerrados.
+# Uso: python archive.py [--retention-days N] [--batch-size N]
+import argparse
+import logging
+import sys
+
+from database import db
+from logging_conf import configure_logging
+
+configure_logging()
+logger = logging.getLogger("chatbot.archive")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--retention-days", type=int)
+    parser.add_argument("--batch-size", type=int)
+    parser.add_argument("--pause", type=float, default=0.1)
+    args = parser.parse_args()
+
+    try:
+        db.ensure_partitions()
+        db.archive_settled(
+            retention_days=args.retention_days,
+            batch_size=args.batch_size,
+            pause=args.pause,
+        )
+        db.purge_processed_updates()
+        db.purge_stats_windows()
+    finally:
+        db.remove_session()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
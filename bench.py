@@ -0,0 +1,98 @@
+# Micro-benchmark de las consultas calientes: CPU por llamada construyendo el
+# select en cada llamada (como antes) frente a las sentencias precompiladas.
+# Uso: python bench.py [--calls N]
+import argparse
+import sys
+import time
+
+from sqlalchemy import select
+
+from database import BetStatus, db
+
+SETTLED = [BetStatus.WIN, BetStatus.LOSE, BetStatus.CANCEL]
+
+
+def rebuilt_get_user(user_id):
+    query = db.users.select().where(db.users.c.user_id == user_id)
+    result = db.session.execute(query)
+    return result.fetchone()._asdict() if result.rowcount else None
+
+
+def rebuilt_get_match(match_id):
+    query = db.matches.select().where(db.matches.c.match_id == match_id)
+    result = db._catalog_session("matches").execute(query)
+    return result.fetchone()._asdict() if result.rowcount else None
+
+
+def rebuilt_get_bet_options_for_match(match_id):
+    # Sin la caché de catálogo, igual que en la versión actual: se mide la
+    # consulta, no el TTLCache
+    db.cache.clear()
+
+    def load():
+        query = db.match_bet_options.select().where(
+            db.match_bet_options.c.match_id == match_id
+        )
+        query = query.where(db.match_bet_options.c.is_active)
+        result = db._catalog_session("bet_options").execute(query)
+        return db._frozen_rows(result)
+
+    return db._cached(("bet_options", match_id, True), load)
+
+
+def rebuilt_get_user_bets(user_id):
+    # Sin sentencias preparadas: _paginate arma la variante en cada llamada
+    query = db.bets.select().where(db.bets.c.user_id == user_id)
+    query = query.where(db.bets.c.status.in_(SETTLED))
+    return db._paginate(query, db.bets.c.created_at, db.bets.c.bet_id, None, 10)
+
+
+def cached_get_bet_options_for_match(match_id):
+    db.cache.clear()
+    return db.get_bet_options_for_match(match_id)
+
+
+def current_get_user_bets(user_id):
+    return db.get_user_bets(user_id, SETTLED)
+
+
+def cpu_per_call(func, arg, calls):
+    func(arg)
+    started = time.process_time()
+    for _ in range(calls):
+        func(arg)
+    return (time.process_time() - started) / calls * 1e6
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    user_id = db.session.execute(select(db.users.c.user_id).limit(1)).scalar() or 0
+    match_id = db.session.execute(select(db.matches.c.match_id).limit(1)).scalar() or 0
+    cases = [
+        ("get_user", rebuilt_get_user, db.get_user, user_id),
+        ("get_match", rebuilt_get_match, db.get_match, match_id),
+        (
+            "get_bet_options_for_match",
+            rebuilt_get_bet_options_for_match,
+            cached_get_bet_options_for_match,
+            match_id,
+        ),
+        ("get_user_bets", rebuilt_get_user_bets, current_get_user_bets, user_id),
+    ]
+
+    print(f"{'consulta':<28}{'antes µs':>10}{'ahora µs':>10}{'mejora':>9}")
+    try:
+        for name, before, after, arg in cases:
+            old = cpu_per_call(before, arg, args.calls)
+            new = cpu_per_call(after, arg, args.calls)
+            print(f"{name:<28}{old:>10.1f}{new:>10.1f}{(1 - new / old):>9.0%}")
+    finally:
+        db.remove_session()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,31 @@
 import telebot
+from telebot import apihelper
+from telebot.handler_backends import BaseMiddleware
+
 from config import config
+from database import db
+from metrics import metrics
+from sender import sender
+
+
+class SessionMiddleware(BaseMiddleware):
+    # Cada update usa su propia sesión de base de datos
+    def __init__(self):
+        self.update_types = ["message", "callback_query"]
+
+    def pre_process(self, message, data):
+        pass
+
+    def post_process(self, message, data, exception):
+        # telebot captura y loguea el error del handler sin relanzarlo:
+        # solo aquí se entera de que el update falló
+        if exception is not None:
+            metrics.incr("updates.failed")
+        db.remove_session()
+
 
-bot = telebot.TeleBot(config.TELEGRAM_TOKEN)
+# Sin el pool interno de telebot: el orden y la concurrencia los lleva dispatcher.py
+bot = telebot.TeleBot(config.TELEGRAM_TOKEN, threaded=False, use_class_middlewares=True)
+bot.setup_middleware(SessionMiddleware())
+# Límites de Telegram, conexiones persistentes y reintentos tras 429
+apihelper.CUSTOM_REQUEST_SENDER = sender.request
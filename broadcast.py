@@ -0,0 +1,135 @@
+# Envía un mensaje a todos los usuarios activos que no bloquearon el bot.
+# Avanza por lotes de user_id y guarda el progreso tras cada lote: si se corta,
+# --resume continúa desde el último lote completo (ese lote puede repetirse).
+# Uso: python broadcast.py --text "..." | --resume ID [--workers N] [--chunk-size N]
+import argparse
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.apihelper import ApiTelegramException
+
+from bot import bot
+from config import config
+from database import db
+from logging_conf import configure_logging
+
+configure_logging()
+logger = logging.getLogger("chatbot.broadcast")
+
+
+def is_blocked(failure: dict) -> bool:
+    # 403: bloqueó el bot o borró la cuenta; 400 "chat not found": nunca lo inició
+    if failure["error_code"] == 403:
+        return True
+    return failure["error_code"] == 400 and "chat not found" in failure["error"]
+
+
+def is_transient(failure: dict) -> bool:
+    # Red caída, 5xx o un 429 que sender.py ya no reintentó: vale la pena insistir
+    code = failure["error_code"]
+    return code is None or code == 429 or code >= 500
+
+
+def send(user_id: int, text: str):
+    try:
+        bot.send_message(user_id, text)
+        return None
+    except ApiTelegramException as exc:
+        return {
+            "user_id": user_id,
+            "error_code": exc.error_code,
+            "error": exc.description,
+        }
+    except Exception as exc:
+        return {"user_id": user_id, "error_code": None, "error": str(exc)}
+
+
+def deliver(user_id: int, text: str):
+    # None si se entregó; si no, el fallo para broadcast_failures. Los fallos
+    # pasajeros se reintentan con espera creciente antes de darlo por fallido
+    for attempt in range(config.BROADCAST_MAX_RETRIES + 1):
+        failure = send(user_id, text)
+        if failure is None or not is_transient(failure):
+            return failure
+        if attempt < config.BROADCAST_MAX_RETRIES:
+            time.sleep(config.BROADCAST_RETRY_BACKOFF * 2**attempt)
+    return failure
+
+
+def run(broadcast: dict, workers: int, chunk_size: int) -> dict:
+    broadcast_id = broadcast["broadcast_id"]
+    last_user_id = broadcast["last_user_id"]
+    sent = broadcast["sent"]
+    failed = broadcast["failed"]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            recipients = db.get_broadcast_recipients(last_user_id, chunk_size)
+            if not recipients:
+                break
+            # El ritmo lo marca sender.py: global y por chat
+            results = pool.map(
+                deliver, recipients, [broadcast["text"]] * len(recipients)
+            )
+            failures = [result for result in results if result]
+            blocked = [row["user_id"] for row in failures if is_blocked(row)]
+            last_user_id = recipients[-1]
+            db.checkpoint_broadcast(
+                broadcast_id,
+                last_user_id,
+                len(recipients) - len(failures),
+                failures,
+                blocked,
+            )
+            sent += len(recipients) - len(failures)
+            failed += len(failures)
+            elapsed = time.perf_counter() - started
+            logger.info(
+                f"Difusión #{broadcast_id}: {sent} enviados, {failed} fallidos "
+                f"({len(blocked)} bloqueos en el lote), {sent / elapsed:.1f} msg/s"
+            )
+
+    db.finish_broadcast(broadcast_id)
+    return {"sent": sent, "failed": failed}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--text")
+    group.add_argument("--resume", type=int)
+    parser.add_argument("--workers", type=int, default=config.BROADCAST_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=config.BROADCAST_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    db.check_schema()
+    try:
+        broadcast_id = args.resume or db.create_broadcast(args.text)
+        # Dos --resume a la vez enviarían cada lote dos veces
+        with db.broadcast_lock(broadcast_id) as acquired:
+            if not acquired:
+                logger.error(f"La difusión #{broadcast_id} ya se está enviando")
+                return 1
+            # Se lee con el lock tomado: el progreso del proceso anterior ya
+            # está guardado
+            broadcast = db.get_broadcast(broadcast_id)
+            if not broadcast:
+                logger.error(f"No existe la difusión #{broadcast_id}")
+                return 1
+            if broadcast["status"] == "done":
+                logger.info(f"La difusión #{broadcast_id} ya terminó")
+                return 0
+            report = run(broadcast, args.workers, args.chunk_size)
+    finally:
+        db.remove_session()
+
+    logger.info(
+        f"Difusión #{broadcast_id} terminada: {report['sent']} enviados, {report['failed']} fallidos"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Tuple
+
+from metrics import metrics
+
+
+class TTLCache:
+    # Claves en forma de tupla (namespace, *ident) para poder invalidar por prefijo
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        metrics.gauge(f"cache.{name}.size", lambda: len(self._data))
+
+    def get_or_load(self, key: Tuple[Hashable, ...], loader: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry and entry[0] > now:
+                self._data.move_to_end(key)
+                metrics.incr(f"cache.{self.name}.hits")
+                return entry[1]
+
+        metrics.incr(f"cache.{self.name}.misses")
+        value = loader()
+        with self._lock:
+            self._data[key] = (now + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return value
+
+    def invalidate(self, *prefix: Hashable):
+        size = len(prefix)
+        with self._lock:
+            for key in [key for key in self._data if key[:size] == prefix]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
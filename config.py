@@ -1,5 +1,5 @@
 import logging
-from typing import Optional
+from typing import Literal, Optional
 
 from pydantic_settings import BaseSettings
 
@@ -20,7 +20,70 @@ class EnvConfig(BaseSettings):
     URL_BOT: Optional[str] = None
     ENV: Optional[str] = None
     DATABASE_URL: Optional[str] = None
+    DATABASE_REPLICA_URL: Optional[str] = None
+    # Retraso máximo esperado de la réplica: tras invalidar se recarga del primario
+    DB_REPLICA_MAX_LAG: float = 10.0
     DB_FORCE_ROLL_BACK: bool = False
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_PARTITIONED: bool = False
+    DB_PARTITION_MONTHS_AHEAD: int = 3
+
+    CACHE_TTL: int = 60
+    CACHE_MAXSIZE: int = 1024
+    CACHE_SYNC_INTERVAL: float = 5.0
+
+    PARLAY_MAX_LEGS: int = 10
+    # Tope de riesgo por opción (None = sin tope); "reject" o "suspend"
+    EXPOSURE_MAX_LIABILITY: Optional[float] = None
+    EXPOSURE_CAP_ACTION: Literal["reject", "suspend"] = "reject"
+
+    ARCHIVE_RETENTION_DAYS: int = 180
+    ARCHIVE_BATCH_SIZE: int = 1000
+
+    # Cola de depósitos/extracciones: tamaño del lote y duración de la reserva
+    ADMIN_QUEUE_BATCH_SIZE: int = 20
+    ADMIN_QUEUE_LEASE_SECONDS: int = 300
+
+    # Despachador de avisos (outbox.py)
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_INTERVAL: float = 1.0
+    OUTBOX_LEASE_SECONDS: int = 60
+    OUTBOX_MAX_ATTEMPTS: int = 8
+
+    # Procesado de updates del webhook: hilos, cola por hilo y espera al apagar
+    UPDATE_WORKERS: int = 8
+    UPDATE_QUEUE_SIZE: int = 200
+    UPDATE_DRAIN_TIMEOUT: float = 10.0
+    # update_id recordados en memoria y horas que se guardan en processed_updates
+    UPDATE_DEDUPE_WINDOW: int = 10000
+    UPDATE_DEDUPE_RETENTION_HOURS: int = 48
+
+    # Envíos a Telegram (sender.py): ~30 msg/s en total y ~1 msg/s por chat
+    TELEGRAM_POOL_SIZE: int = 16
+    TELEGRAM_GLOBAL_RATE: float = 30.0
+    # Procesos que envían a la vez (workers de gunicorn, outbox.py,
+    # broadcast.py...): cada uno usa TELEGRAM_GLOBAL_RATE / TELEGRAM_PROCESSES
+    TELEGRAM_PROCESSES: int = 1
+    TELEGRAM_CHAT_RATE: float = 1.0
+    TELEGRAM_CHAT_BURST: float = 3.0
+    TELEGRAM_MAX_TRACKED_CHATS: int = 10000
+    TELEGRAM_MAX_RETRIES: int = 3
+    TELEGRAM_TYPING_DELAY: float = 0.5
+    TELEGRAM_TYPING_INTERVAL: float = 5.0
+
+    # Difusiones masivas (broadcast.py)
+    BROADCAST_CHUNK_SIZE: int = 500
+    BROADCAST_WORKERS: int = 8
+    # Reintentos de fallos pasajeros (red, 5xx); la espera se duplica en cada uno
+    BROADCAST_MAX_RETRIES: int = 3
+    BROADCAST_RETRY_BACKOFF: float = 1.0
+
+    # Botones por página en los teclados del catálogo
+    KEYBOARD_PAGE_SIZE: int = 8
 
 
 config = EnvConfig()
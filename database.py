@@ -1,33 +1,92 @@
+import json
 import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
 from enum import Enum
-from typing import Dict, List, Optional
+from types import MappingProxyType
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
-from sqlalchemy import TIMESTAMP, BigInteger, Boolean, Column
+from sqlalchemy import (
+    JSON,
+    TIMESTAMP,
+    BigInteger,
+    Boolean,
+    Column,
+    Date,
+)
 from sqlalchemy import Enum as SQLAlchemyEnum
 from sqlalchemy import (
     ForeignKey,
+    Index,
     Integer,
     MetaData,
     Numeric,
     String,
     Table,
     Text,
+    bindparam,
+    case,
+    cast,
     create_engine,
     delete,
+    event,
     insert,
+    inspect,
+    literal,
+    literal_column,
     or_,
+    select,
+    text,
+    true,
+    tuple_,
+    union_all,
     update,
 )
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError, ProgrammingError
 from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.sql import func
 
+from cache import TTLCache
 from config import config
 from logging_conf import configure_logging
+from metrics import metrics
 
 # Configuración de logging
 configure_logging()
 logger = logging.getLogger("chatbot.database")
 
+# Subir al cambiar el esquema; init.py la registra y los workers la comprueban
+SCHEMA_VERSION = 11
+
+# Índices reemplazados por otros; init.py los borra en bases ya creadas
+OBSOLETE_INDEXES = [
+    # Incluía match_date: un partido reprogramado entraba como otro nuevo
+    "ix_matches_natural_key",
+    # Sustituido por el índice parcial de transacciones pendientes
+    "ix_transactions_status_created_at",
+    # Sin el id del desempate del cursor
+    "ix_transactions_user_id_created_at",
+    "ix_transfers_sender_id_created_at",
+    "ix_transfers_receiver_id_created_at",
+]
+
 
 class TransactionType(Enum):
     DEPOSIT = "deposit"
@@ -45,12 +104,99 @@ class BetStatus(Enum):
     LOSE = "lose"
 
 
+class StatsWindow(Enum):
+    DAY = "day"
+    WEEK = "week"
+    ALL = "all"
+
+
+class TransactionAborted(Exception):
+    pass
+
+
+class SchemaOutdated(Exception):
+    pass
+
+
+class ExposureLimitExceeded(Exception):
+    pass
+
+
+class MigrationError(Exception):
+    pass
+
+
+class RowMode(Enum):
+    DICT = "dict"  # lista de dicts, el formato de siempre
+    ROW = "row"  # lista de Row: tuplas con nombre, sin un dict por fila
+    STREAM = "stream"  # generador de Row con cursor del lado del servidor
+
+
+class Page(NamedTuple):
+    items: List[Dict]
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def encode_cursor(direction: str, created_at: datetime, row_id: int) -> str:
+    # Compacto para que quepa en el callback_data de Telegram (64 bytes)
+    micros = (created_at - EPOCH) // timedelta(microseconds=1)
+    return f"{direction}{micros:x}.{row_id:x}"
+
+
+def decode_cursor(cursor: str):
+    # Llega en callback_data: cualquier cosa que no salga de encode_cursor es
+    # ValueError, nunca IndexError u OverflowError
+    try:
+        direction, (micros, row_id) = cursor[0], cursor[1:].split(".")
+        if direction not in ("n", "p"):
+            raise ValueError(direction)
+        created_at = EPOCH + timedelta(microseconds=int(micros, 16))
+        return direction, created_at, int(row_id, 16)
+    except (IndexError, OverflowError, ValueError):
+        raise ValueError(f"Cursor inválido: {cursor!r}") from None
+
+
+class TimedQueuePool(QueuePool):
+    # Mide cuánto espera cada checkout por una conexión libre del pool
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.observe("db.pool.checkout_wait", time.perf_counter() - started)
+
+
 class DatabaseManager:
-    def __init__(self, database_url: str):
+    def __init__(self, database_url: str, replica_url: Optional[str] = None):
         self.database_url = database_url
         self.metadata = MetaData()
-        self.engine = create_engine(database_url)
-        self.Session = scoped_session(sessionmaker(bind=self.engine))
+        self.engine = self._create_engine(database_url, "db.pool")
+        # Una sesión por hilo/greenlet; se libera al terminar cada request o update
+        session_factory = sessionmaker(bind=self.engine)
+        self.Session = scoped_session(session_factory)
+
+        # Réplica opcional para lecturas de catálogo e historial
+        self.read_engine = self.engine
+        self.ReadSession = None
+        if replica_url:
+            self.read_engine = self._create_engine(replica_url, "db.replica_pool")
+            self.ReadSession = scoped_session(sessionmaker(bind=self.read_engine))
+            event.listen(session_factory, "after_commit", self._pin_to_primary)
+
+        # Caché de catálogo; los demás workers se enteran vía cache_invalidations
+        self.cache = TTLCache("db", config.CACHE_MAXSIZE, config.CACHE_TTL)
+        self._cache_versions: Dict[Tuple[str, str], int] = {}
+        self._cache_seen_at: Optional[datetime] = None
+        self._cache_synced_at = 0.0
+        self._cache_sync_lock = threading.Lock()
+        # Última invalidación vista por namespace (local o de otro worker)
+        self._invalidated_at: Dict[str, float] = {}
+        event.listen(session_factory, "after_commit", self._apply_invalidations)
+        event.listen(session_factory, "after_rollback", self._discard_invalidations)
 
         # Definición de tablas
         self.users = Table("users", self.metadata, *self._get_user_columns())
@@ -71,26 +217,152 @@ class DatabaseManager:
             "match_bet_options", self.metadata, *self._get_match_bet_option_columns()
         )
 
-        self.bets = Table("bets", self.metadata, *self._get_bet_columns())
+        self.bets = Table(
+            "bets",
+            self.metadata,
+            *self._get_bet_columns(),
+            **self._partition_options(),
+        )
 
         self.transactions = Table(
-            "transactions", self.metadata, *self._get_transaction_columns()
+            "transactions",
+            self.metadata,
+            *self._get_transaction_columns(),
+            **self._partition_options(),
         )
 
         self.transfers = Table(
             "transfers", self.metadata, *self._get_transfer_columns()
         )
 
-        self.metadata.create_all(self.engine)
+        self.bet_idempotency_keys = Table(
+            "bet_idempotency_keys",
+            self.metadata,
+            *self._get_bet_idempotency_key_columns(),
+        )
+
+        # Una fila por clave invalidada: (namespace, ident) con su versión
+        self.cache_invalidations = Table(
+            "cache_invalidations",
+            self.metadata,
+            *self._get_cache_invalidation_columns(),
+        )
+
+        self.user_stats = Table(
+            "user_stats", self.metadata, *self._get_user_stats_columns()
+        )
+
+        self.balance_snapshots = Table(
+            "balance_snapshots", self.metadata, *self._get_balance_snapshot_columns()
+        )
+
+        # Combinadas: una apuesta sobre varias opciones con cuota multiplicada
+        self.parlays = Table("parlays", self.metadata, *self._get_parlay_columns())
+
+        self.parlay_legs = Table(
+            "parlay_legs", self.metadata, *self._get_parlay_leg_columns()
+        )
+
+        # Riesgo de la casa por opción, al día con cada apuesta y liquidación
+        self.option_exposure = Table(
+            "option_exposure", self.metadata, *self._get_option_exposure_columns()
+        )
+
+        # Avisos pendientes de enviar, escritos en la misma transacción que el
+        # movimiento de dinero; outbox.py los entrega fuera de ella
+        self.outbox = Table("outbox", self.metadata, *self._get_outbox_columns())
+
+        # Filas frías que salen de bets y transactions tras la retención
+        self.bets_archive = Table(
+            "bets_archive", self.metadata, *self._get_archive_columns(self.bets)
+        )
+
+        self.transactions_archive = Table(
+            "transactions_archive",
+            self.metadata,
+            *self._get_archive_columns(self.transactions),
+        )
+
+        # Difusiones masivas: avance por user_id y destinatarios que fallaron
+        self.broadcasts = Table(
+            "broadcasts", self.metadata, *self._get_broadcast_columns()
+        )
+
+        self.broadcast_failures = Table(
+            "broadcast_failures", self.metadata, *self._get_broadcast_failure_columns()
+        )
+
+        # update_id de Telegram ya procesados, compartidos por todos los workers
+        self.processed_updates = Table(
+            "processed_updates", self.metadata, *self._get_processed_update_columns()
+        )
+
+        self.schema_version = Table(
+            "schema_version", self.metadata, *self._get_schema_version_columns()
+        )
+
+        self._define_indexes()
+        self._define_statements()
+        self._schema_checked = False
+
+    def _create_engine(self, url: str, metrics_prefix: str):
+        engine = create_engine(
+            url,
+            poolclass=TimedQueuePool,
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT,
+            pool_recycle=config.DB_POOL_RECYCLE,
+            pool_pre_ping=config.DB_POOL_PRE_PING,
+        )
+        pool = engine.pool
+        metrics.gauge(f"{metrics_prefix}.size", pool.size)
+        metrics.gauge(f"{metrics_prefix}.checked_out", pool.checkedout)
+        metrics.gauge(f"{metrics_prefix}.checked_in", pool.checkedin)
+        metrics.gauge(f"{metrics_prefix}.overflow", pool.overflow)
+        return engine
+
+    @property
+    def session(self):
+        return self.Session()
+
+    @property
+    def read_session(self):
+        # Solo catálogo y agregados globales: nada de dinero ni historial del
+        # usuario, que siempre se lee del primario. Tras escribir, el request
+        # sigue en el primario
+        if (
+            self.ReadSession is None
+            or self.in_transaction
+            or self.session.info.get("pinned_to_primary")
+        ):
+            return self.session
+        return self.ReadSession()
+
+    def _pin_to_primary(self, session):
+        session.info["pinned_to_primary"] = True
+
+    def _catalog_session(self, namespace: str):
+        # Justo después de una invalidación la réplica puede no tener aún el
+        # cambio: recargar de ella dejaría lo viejo en caché otro TTL entero
+        invalidated_at = self._invalidated_at.get(namespace, float("-inf"))
+        if time.monotonic() - invalidated_at < config.DB_REPLICA_MAX_LAG:
+            return self.session
+        return self.read_session
 
     def connect(self):
-        self.session = self.Session()
+        self.Session()
         logger.info("Connected to database")
 
     def disconnect(self):
-        if hasattr(self, "session"):
-            self.session.close()
-            logger.info("Disconnected from database")
+        self.remove_session()
+        logger.info("Disconnected from database")
+
+    def remove_session(self):
+        # Devuelve la conexión al pool y descarta la sesión del request actual
+        self.Session.remove()
+        if self.ReadSession is not None:
+            self.ReadSession.remove()
 
     def __enter__(self):
         self.connect()
@@ -99,6 +371,263 @@ class DatabaseManager:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.disconnect()
 
+    # Unidad de trabajo: los helpers dentro del bloque comparten un único commit
+    @contextmanager
+    def transaction(self):
+        info = self.session.info
+        depth = info.get("transaction_depth", 0)
+        info["transaction_depth"] = depth + 1
+        try:
+            yield self
+        except Exception:
+            if depth:
+                info["rollback_only"] = True
+            else:
+                self.session.rollback()
+                info.pop("rollback_only", None)
+            raise
+        else:
+            if not depth:
+                if info.pop("rollback_only", False):
+                    self.session.rollback()
+                    raise TransactionAborted("Una operación anidada falló")
+                self.session.commit()
+        finally:
+            info["transaction_depth"] = depth
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.session.info.get("transaction_depth", 0) > 0
+
+    def _commit(self):
+        if not self.in_transaction:
+            self.session.commit()
+
+    # Índices secundarios para las consultas más frecuentes
+    def _define_indexes(self):
+        Index("ix_bets_user_id_status", self.bets.c.user_id, self.bets.c.status)
+        Index(
+            "ix_bets_user_id_created_at",
+            self.bets.c.user_id,
+            self.bets.c.created_at,
+            self.bets.c.bet_id,
+        )
+        Index("ix_bets_option_id_status", self.bets.c.option_id, self.bets.c.status)
+        # Solo las pendientes: la cola de aprobación no crece con el histórico
+        # Lotes del archivado: lo liquidado antes del corte, más viejo primero
+        Index("ix_bets_created_at", self.bets.c.created_at)
+        Index("ix_transactions_created_at", self.transactions.c.created_at)
+        Index(
+            "ix_transactions_pending_created_at",
+            self.transactions.c.created_at,
+            postgresql_where=self.transactions.c.status == "pending",
+        )
+        # Con el id del desempate del cursor: la página sale del índice sin ordenar
+        Index(
+            "ix_transactions_user_id_created_at_id",
+            self.transactions.c.user_id,
+            self.transactions.c.created_at,
+            self.transactions.c.transaction_id,
+        )
+        Index(
+            "ix_matches_status_match_date",
+            self.matches.c.status,
+            self.matches.c.match_date,
+        )
+        Index(
+            "ix_matches_competition_id_match_date",
+            self.matches.c.competition_id,
+            self.matches.c.match_date,
+        )
+        Index(
+            "ix_match_bet_options_match_id_is_active",
+            self.match_bet_options.c.match_id,
+            self.match_bet_options.c.is_active,
+        )
+        Index(
+            "ix_transactions_effective_at",
+            func.coalesce(
+                self.transactions.c.processed_at, self.transactions.c.created_at
+            ),
+        )
+        Index("ix_competitions_sport_id", self.competitions.c.sport_id)
+        Index(
+            "ix_outbox_pending_available_at",
+            self.outbox.c.available_at,
+            postgresql_where=self.outbox.c.status == "pending",
+        )
+        Index("ix_option_exposure_match_id", self.option_exposure.c.match_id)
+        Index("ix_option_exposure_liability", self.option_exposure.c.liability)
+        Index(
+            "ix_parlays_user_id_created_at",
+            self.parlays.c.user_id,
+            self.parlays.c.created_at,
+            self.parlays.c.parlay_id,
+        )
+        Index(
+            "ix_parlays_idempotency_key",
+            self.parlays.c.idempotency_key,
+            unique=True,
+            postgresql_where=self.parlays.c.idempotency_key.isnot(None),
+        )
+        Index(
+            "ix_parlay_legs_option_id_status",
+            self.parlay_legs.c.option_id,
+            self.parlay_legs.c.status,
+        )
+        # Claves naturales para las cargas masivas de cuotas. El partido se
+        # identifica sin la fecha para que reprogramarlo lo actualice; solo
+        # entre los pendientes, así los mismos equipos pueden volver a jugar
+        Index(
+            "ix_matches_fixture_key",
+            self.matches.c.competition_id,
+            self.matches.c.team_home,
+            self.matches.c.team_away,
+            unique=True,
+            postgresql_where=self.matches.c.status == "pending",
+        )
+        Index(
+            "ix_match_bet_options_natural_key",
+            self.match_bet_options.c.match_id,
+            self.match_bet_options.c.bet_type_id,
+            self.match_bet_options.c.prediction,
+            unique=True,
+        )
+        Index(
+            "ix_user_stats_leaderboard",
+            self.user_stats.c.period,
+            self.user_stats.c.period_start,
+            self.user_stats.c.net_profit,
+        )
+        Index(
+            "ix_transfers_sender_id_created_at_id",
+            self.transfers.c.sender_id,
+            self.transfers.c.created_at,
+            self.transfers.c.transfer_id,
+        )
+        Index(
+            "ix_transfers_receiver_id_created_at_id",
+            self.transfers.c.receiver_id,
+            self.transfers.c.created_at,
+            self.transfers.c.transfer_id,
+        )
+
+    # Preparación del esquema: una vez por despliegue (init.py), nunca en los workers
+    def init_schema(self):
+        started = time.perf_counter()
+        self.metadata.create_all(self.engine)
+        self._add_missing_columns()
+        self._ensure_indexes()
+        self.ensure_partitions()
+        with self.engine.begin() as connection:
+            query = pg_insert(self.schema_version).values(version=SCHEMA_VERSION)
+            connection.execute(query.on_conflict_do_nothing())
+        self._schema_checked = True
+        logger.info(
+            f"Esquema v{SCHEMA_VERSION} listo en {time.perf_counter() - started:.3f}s"
+        )
+
+    def check_schema(self):
+        # Una sola consulta por worker, en el primer request
+        if self._schema_checked:
+            return
+        try:
+            version = self.session.execute(
+                select(func.max(self.schema_version.c.version))
+            ).scalar()
+        except ProgrammingError:
+            self.session.rollback()
+            version = None
+        if version is None or version < SCHEMA_VERSION:
+            raise SchemaOutdated(
+                f"Esquema v{version}, se esperaba v{SCHEMA_VERSION}: ejecuta init.py"
+            )
+        self._schema_checked = True
+
+    def _add_missing_columns(self):
+        # create_all no agrega columnas nuevas a tablas que ya existen
+        inspector = inspect(self.engine)
+        with self.engine.begin() as connection:
+            for table in self.metadata.sorted_tables:
+                columns = inspector.get_columns(table.name)
+                existing = {column["name"] for column in columns}
+                for column in table.columns:
+                    if column.name not in existing:
+                        ddl = CreateColumn(column).compile(dialect=self.engine.dialect)
+                        connection.execute(
+                            text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}")
+                        )
+                        logger.info(f"Columna {table.name}.{column.name} agregada")
+
+    # Consultas calientes construidas una sola vez; en cada llamada solo cambian
+    # los parámetros y SQLAlchemy reutiliza la compilación de su caché
+    def _define_statements(self):
+        self._user_query = self.users.select().where(
+            self.users.c.user_id == bindparam("user_id")
+        )
+        self._match_query = self.matches.select().where(
+            self.matches.c.match_id == bindparam("match_id")
+        )
+        self._bet_options_query = self.match_bet_options.select().where(
+            self.match_bet_options.c.match_id == bindparam("match_id")
+        )
+        self._active_bet_options_query = self._bet_options_query.where(
+            self.match_bet_options.c.is_active
+        )
+        self._user_bets_query = self.bets.select().where(
+            self.bets.c.user_id == bindparam("user_id")
+        )
+        self._user_bets_pages = {
+            False: self._page_statements(
+                self._user_bets_query, self.bets.c.created_at, self.bets.c.bet_id
+            ),
+            True: self._page_statements(
+                self._user_bets_query.where(
+                    self.bets.c.status.in_(bindparam("statuses", expanding=True))
+                ),
+                self.bets.c.created_at,
+                self.bets.c.bet_id,
+            ),
+        }
+
+    def _ensure_indexes(self):
+        # create_all no agrega índices a tablas que ya existen
+        inspector = inspect(self.engine)
+        with self.engine.begin() as connection:
+            for name in OBSOLETE_INDEXES:
+                connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        for table in self.metadata.sorted_tables:
+            existing = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing:
+                    continue
+                if index.unique:
+                    self._check_duplicates(index)
+                index.create(self.engine, checkfirst=True)
+
+    def _check_duplicates(self, index: Index):
+        # Un índice único nuevo falla a medias si ya hay filas repetidas: se
+        # avisa con cuáles son, para resolverlas a mano (pueden tener apuestas)
+        columns = list(index.columns)
+        query = (
+            select(*columns, func.count().label("rows"))
+            .group_by(*columns)
+            .having(func.count() > 1)
+            .limit(10)
+        )
+        where = index.dialect_options["postgresql"]["where"]
+        if where is not None:
+            query = query.where(where)
+        with self.engine.connect() as connection:
+            duplicates = connection.execute(query).fetchall()
+        if duplicates:
+            keys = "; ".join(str(tuple(row)) for row in duplicates)
+            raise MigrationError(
+                f"No se puede crear {index.name}: hay filas repetidas en "
+                f"{index.table.name} ({', '.join(c.name for c in columns)}, "
+                f"filas): {keys}. Unifícalas y vuelve a ejecutar init.py"
+            )
+
     # Métodos auxiliares para definir columnas
     def _get_user_columns(self):
         return [
@@ -115,6 +644,8 @@ class DatabaseManager:
             ),
             Column("is_active", Boolean, nullable=False, server_default="true"),
             Column("is_admin", Boolean, nullable=False, server_default="false"),
+            # Telegram respondió 403: no se le envía nada hasta que vuelva
+            Column("bot_blocked_at", TIMESTAMP),
         ]
 
     def _get_sport_columns(self):
@@ -182,11 +713,13 @@ class DatabaseManager:
             Column("prediction", String(100), nullable=False),
             Column("odds", Numeric(5, 2), nullable=False),
             Column("is_active", Boolean, nullable=False, server_default="true"),
+            # Tope de riesgo propio; si es NULL se usa EXPOSURE_MAX_LIABILITY
+            Column("max_liability", Numeric(15, 2)),
         ]
 
     def _get_bet_columns(self):
         return [
-            Column("bet_id", Integer, primary_key=True),
+            Column("bet_id", Integer, primary_key=True, autoincrement=True),
             Column(
                 "user_id",
                 BigInteger,
@@ -202,13 +735,19 @@ class DatabaseManager:
             Column("amount", Numeric(10, 2), nullable=False),
             Column("potential_win", Numeric(10, 2), nullable=False),
             Column("status", SQLAlchemyEnum(BetStatus), nullable=False, server_default="PENDING"),
-            Column("created_at", TIMESTAMP, nullable=False, server_default=func.now()),
+            Column(
+                "created_at",
+                TIMESTAMP,
+                nullable=False,
+                server_default=func.now(),
+                primary_key=config.DB_PARTITIONED,
+            ),
             Column("settled_at", TIMESTAMP),
         ]
 
     def _get_transaction_columns(self):
         return [
-            Column("transaction_id", Integer, primary_key=True),
+            Column("transaction_id", Integer, primary_key=True, autoincrement=True),
             Column(
                 "user_id",
                 BigInteger,
@@ -223,9 +762,41 @@ class DatabaseManager:
                 "admin_id", BigInteger, ForeignKey("users.user_id", ondelete="CASCADE")
             ),
             Column("proof_image", String(255)),
-            Column("created_at", TIMESTAMP, nullable=False, server_default=func.now()),
+            Column(
+                "created_at",
+                TIMESTAMP,
+                nullable=False,
+                server_default=func.now(),
+                primary_key=config.DB_PARTITIONED,
+            ),
             Column("processed_at", TIMESTAMP),
+            # Reserva de la cola de administración: quién la tiene y desde cuándo
+            Column("claimed_by", BigInteger),
+            Column("claimed_at", TIMESTAMP),
+        ]
+
+    def _partition_options(self) -> Dict:
+        # Particiones mensuales por created_at; por eso entra en la PK
+        if not config.DB_PARTITIONED:
+            return {}
+        return {"postgresql_partition_by": "RANGE (created_at)"}
+
+    def _get_archive_columns(self, table: Table):
+        # Misma forma que la tabla viva, sin FKs, secuencias ni índices
+        columns = [
+            Column(
+                column.name,
+                column.type,
+                primary_key=column.primary_key and column.name != "created_at",
+                autoincrement=False,
+                nullable=column.nullable,
+            )
+            for column in table.columns
         ]
+        columns.append(
+            Column("archived_at", TIMESTAMP, nullable=False, server_default=func.now())
+        )
+        return columns
 
     def _get_transfer_columns(self):
         return [
@@ -246,107 +817,847 @@ class DatabaseManager:
             Column("created_at", TIMESTAMP, nullable=False, server_default=func.now()),
         ]
 
-    # CRUD para Users
-    def create_user(self, user_data: Dict) -> int:
-        query = insert(self.users).values(user_data)
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.inserted_primary_key[0]
-
-    def get_user(self, user_id: int) -> Optional[Dict]:
-        logger.debug("get_user")
-        query = self.users.select().where(self.users.c.user_id == user_id)
-        result = self.session.execute(query)
-        return result.fetchone()._asdict() if result.rowcount else None
+    def _get_bet_idempotency_key_columns(self):
+        return [
+            Column("idempotency_key", String(64), primary_key=True),
+            Column("bet_id", Integer, nullable=False),
+            Column("created_at", TIMESTAMP, nullable=False, server_default=func.now()),
+        ]
 
-    def update_user(self, user_id: int, user_data: Dict) -> bool:
-        logger.debug("update_user")
-        query = (
-            update(self.users).where(self.users.c.user_id == user_id).values(user_data)
-        )
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.rowcount > 0
+    def _get_schema_version_columns(self):
+        return [
+            Column("version", Integer, primary_key=True),
+            Column("applied_at", TIMESTAMP, nullable=False, server_default=func.now()),
+        ]
 
-    def delete_user(self, user_id: int) -> bool:
-        logger.debug("delete_user")
-        query = delete(self.users).where(self.users.c.user_id == user_id)
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.rowcount > 0
+    def _get_broadcast_columns(self):
+        return [
+            Column("broadcast_id", Integer, primary_key=True),
+            Column("text", Text, nullable=False),
+            Column("status", String(20), nullable=False, server_default="pending"),
+            # Último destinatario de un lote ya enviado: se reanuda desde aquí
+            Column("last_user_id", BigInteger, nullable=False, server_default="0"),
+            Column("sent", Integer, nullable=False, server_default="0"),
+            Column("failed", Integer, nullable=False, server_default="0"),
+            Column(
+                "created_by",
+                BigInteger,
+                ForeignKey("users.user_id", ondelete="SET NULL"),
+            ),
+            Column("created_at", TIMESTAMP, nullable=False, server_default=func.now()),
+            Column("finished_at", TIMESTAMP),
+        ]
 
-    def update_user_balance(self, user_id: int, amount: float) -> bool:
-        logger.debug("update_user_balance")
-        query = (
-            update(self.users)
-            .where(self.users.c.user_id == user_id)
-            .values(balance=self.users.c.balance + amount)
-        )
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.rowcount > 0
+    def _get_broadcast_failure_columns(self):
+        return [
+            Column(
+                "broadcast_id",
+                Integer,
+                ForeignKey("broadcasts.broadcast_id", ondelete="CASCADE"),
+                primary_key=True,
+            ),
+            Column("user_id", BigInteger, primary_key=True),
+            Column("error_code", Integer),
+            Column("error", Text),
+            Column("created_at", TIMESTAMP, nullable=False, server_default=func.now()),
+        ]
 
-    # CRUD para Sports
-    def create_sport(self, sport_data: Dict) -> int:
-        logger.debug("create_sport")
-        query = insert(self.sports).values(sport_data)
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.inserted_primary_key[0]
+    def _get_processed_update_columns(self):
+        return [
+            Column("update_id", BigInteger, primary_key=True, autoincrement=False),
+            Column(
+                "received_at",
+                TIMESTAMP,
+                nullable=False,
+                server_default=func.now(),
+                index=True,
+            ),
+        ]
 
-    def get_sport(self, sport_id: int) -> Optional[Dict]:
-        logger.debug("get_sport")
-        query = self.sports.select().where(self.sports.c.sport_id == sport_id)
-        result = self.session.execute(query)
-        return result.fetchone()._asdict() if result.rowcount else None
+    def _get_cache_invalidation_columns(self):
+        return [
+            Column("namespace", String(50), primary_key=True),
+            # ident en JSON: "[]" para el namespace entero, "[12]" para una clave
+            Column("ident", String(100), primary_key=True),
+            Column("version", BigInteger, nullable=False, server_default="1"),
+            Column(
+                "updated_at",
+                TIMESTAMP,
+                nullable=False,
+                server_default=func.now(),
+                index=True,
+            ),
+        ]
 
-    def get_all_active_sports(self) -> List[Dict]:
-        logger.debug("get_all_active_sports")
-        query = self.sports.select().where(self.sports.c.is_active)
-        result = self.session.execute(query)
+    # Forma del resultado de los métodos de listado
+    def _rows(self, query, mode: RowMode = RowMode.DICT, session=None) -> Iterable:
+        session = session or self.session
+        if mode is RowMode.STREAM:
+            return self._stream(session, query)
+        result = session.execute(query)
+        if mode is RowMode.ROW:
+            return result.fetchall()
         return [row._asdict() for row in result.fetchall()]
 
-    def update_sport(self, sport_id: int, sport_data: Dict) -> bool:
-        logger.debug("update_sport")
-        query = (
-            update(self.sports)
-            .where(self.sports.c.sport_id == sport_id)
-            .values(sport_data)
+    def _stream(self, session, query, chunk_size: int = 500) -> Iterator:
+        # No ejecuta nada hasta la primera iteración; hay que consumirlo antes
+        # de liberar la sesión
+        result = session.execute(query, execution_options={"yield_per": chunk_size})
+        yield from result
+
+    # Paginación por keyset sobre (created_at, id), más reciente primero. La
+    # posición y el límite van como parámetros: cada variante se compila una vez
+    @staticmethod
+    def _page_statement(query, created_at, row_id, direction: str, keyed: bool):
+        key = tuple_(
+            bindparam("key_created_at", type_=created_at.type),
+            bindparam("key_id", type_=row_id.type),
         )
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.rowcount > 0
-
-    def delete_sport(self, sport_id: int) -> bool:
-        logger.debug("delete_sport")
-        query = delete(self.sports).where(self.sports.c.sport_id == sport_id)
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.rowcount > 0
-
-    # CRUD para Competitions
-    def create_competition(self, competition_data: Dict) -> int:
-        logger.debug("create_competition")
-        query = insert(self.competitions).values(competition_data)
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.inserted_primary_key[0]
+        if direction == "n":
+            if keyed:
+                query = query.where(tuple_(created_at, row_id) < key)
+            query = query.order_by(created_at.desc(), row_id.desc())
+        else:
+            query = query.where(tuple_(created_at, row_id) > key)
+            query = query.order_by(created_at.asc(), row_id.asc())
+        return query.limit(bindparam("page_limit"))
+
+    @classmethod
+    def _page_statements(cls, query, created_at, row_id) -> Dict[Tuple, Any]:
+        # Primera página, siguientes y anteriores (estas siempre con cursor)
+        return {
+            variant: cls._page_statement(query, created_at, row_id, *variant)
+            for variant in (("n", False), ("n", True), ("p", True))
+        }
+
+    def _paginate(
+        self,
+        query,
+        created_at,
+        row_id,
+        cursor: str,
+        limit: int,
+        params: Optional[Dict] = None,
+        statements: Optional[Dict[Tuple, Any]] = None,
+    ) -> Page:
+        direction, key = "n", None
+        if cursor:
+            direction, *key = decode_cursor(cursor)
+
+        variant = (direction, bool(key))
+        if statements:
+            query = statements[variant]
+        else:
+            query = self._page_statement(query, created_at, row_id, *variant)
+        params = {**(params or {}), "page_limit": limit + 1}
+        if key:
+            params.update(key_created_at=key[0], key_id=key[1])
+
+        # Historial del propio usuario: del primario, para que vea su apuesta
+        # o movimiento recién hecho aunque la réplica vaya atrasada
+        result = self.session.execute(query, params)
+        rows = [row._asdict() for row in result.fetchall()]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if direction == "p":
+            rows.reverse()
+        if not rows:
+            return Page([], None, None)
+
+        if direction == "n":
+            has_next, has_prev = has_more, bool(key)
+        else:
+            has_next, has_prev = True, has_more
+
+        first, last = rows[0], rows[-1]
+        next_cursor = prev_cursor = None
+        if has_next:
+            next_cursor = encode_cursor("n", last["created_at"], last[row_id.key])
+        if has_prev:
+            prev_cursor = encode_cursor("p", first["created_at"], first[row_id.key])
+        return Page(rows, next_cursor, prev_cursor)
+
+    def _get_user_stats_columns(self):
+        # Una fila por usuario y ventana (día, semana, histórico)
+        return [
+            Column("period", String(10), primary_key=True),
+            Column("period_start", Date, primary_key=True),
+            Column(
+                "user_id",
+                BigInteger,
+                ForeignKey("users.user_id", ondelete="CASCADE"),
+                primary_key=True,
+            ),
+            Column("total_staked", Numeric(15, 2), nullable=False, server_default="0"),
+            Column("total_won", Numeric(15, 2), nullable=False, server_default="0"),
+            Column("net_profit", Numeric(15, 2), nullable=False, server_default="0"),
+            Column("bets_count", Integer, nullable=False, server_default="0"),
+            Column("win_count", Integer, nullable=False, server_default="0"),
+            Column("current_streak", Integer, nullable=False, server_default="0"),
+            Column("updated_at", TIMESTAMP, nullable=False, server_default=func.now()),
+        ]
 
-    def get_competition(self, competition_id: int) -> Optional[Dict]:
-        logger.debug("get_competition")
-        query = self.competitions.select().where(
-            self.competitions.c.competition_id == competition_id
-        )
-        result = self.session.execute(query)
-        return result.fetchone()._asdict() if result.rowcount else None
+    def _get_balance_snapshot_columns(self):
+        return [
+            Column(
+                "user_id",
+                BigInteger,
+                ForeignKey("users.user_id", ondelete="CASCADE"),
+                primary_key=True,
+            ),
+            Column("balance", Numeric(15, 2), nullable=False),
+            Column("as_of", TIMESTAMP, nullable=False),
+            Column("taken_at", TIMESTAMP, nullable=False, server_default=func.now()),
+        ]
 
-    def get_competitions_by_sport(self, sport_id: int) -> List[Dict]:
-        logger.debug("get_competitions_by_sport")
-        query = self.competitions.select().where(
-            self.competitions.c.sport_id == sport_id
-        )
-        result = self.session.execute(query)
-        return [row._asdict() for row in result.fetchall()]
+    def _get_parlay_columns(self):
+        return [
+            Column("parlay_id", Integer, primary_key=True),
+            Column(
+                "user_id",
+                BigInteger,
+                ForeignKey("users.user_id", ondelete="CASCADE"),
+                nullable=False,
+            ),
+            Column("amount", Numeric(10, 2), nullable=False),
+            Column("combined_odds", Numeric(12, 2), nullable=False),
+            Column("potential_win", Numeric(15, 2), nullable=False),
+            Column(
+                "status",
+                SQLAlchemyEnum(BetStatus),
+                nullable=False,
+                server_default="PENDING",
+            ),
+            Column("legs_count", Integer, nullable=False),
+            # Selecciones sin resolver; al llegar a 0 se liquida la combinada
+            Column("pending_legs", Integer, nullable=False),
+            # Clave del cliente: un update reentregado no repite la combinada
+            Column("idempotency_key", String(64)),
+            Column("created_at", TIMESTAMP, nullable=False, server_default=func.now()),
+            Column("settled_at", TIMESTAMP),
+        ]
+
+    def _get_parlay_leg_columns(self):
+        return [
+            Column("leg_id", Integer, primary_key=True),
+            Column(
+                "parlay_id",
+                Integer,
+                ForeignKey("parlays.parlay_id", ondelete="CASCADE"),
+                nullable=False,
+            ),
+            Column(
+                "option_id",
+                Integer,
+                ForeignKey("match_bet_options.option_id", ondelete="CASCADE"),
+                nullable=False,
+            ),
+            Column("odds", Numeric(5, 2), nullable=False),
+            Column(
+                "status",
+                SQLAlchemyEnum(BetStatus),
+                nullable=False,
+                server_default="PENDING",
+            ),
+            Column("settled_at", TIMESTAMP),
+        ]
+
+    def _get_option_exposure_columns(self):
+        return [
+            Column(
+                "option_id",
+                Integer,
+                ForeignKey("match_bet_options.option_id", ondelete="CASCADE"),
+                primary_key=True,
+            ),
+            Column(
+                "match_id",
+                Integer,
+                ForeignKey("matches.match_id", ondelete="CASCADE"),
+                nullable=False,
+            ),
+            Column("total_staked", Numeric(15, 2), nullable=False, server_default="0"),
+            # Lo que se pagaría si ganan todas las apuestas pendientes
+            Column("liability", Numeric(15, 2), nullable=False, server_default="0"),
+            Column("payout", Numeric(15, 2), nullable=False, server_default="0"),
+            Column("bets_count", Integer, nullable=False, server_default="0"),
+            # Tope vigente en la última apuesta
+            Column("max_liability", Numeric(15, 2)),
+            Column("updated_at", TIMESTAMP, nullable=False, server_default=func.now()),
+        ]
+
+    def _get_outbox_columns(self):
+        return [
+            Column("event_id", BigInteger, primary_key=True, autoincrement=True),
+            Column("user_id", BigInteger, nullable=False),
+            Column("event_type", String(50), nullable=False),
+            Column("payload", JSON, nullable=False),
+            Column("status", String(20), nullable=False, server_default="pending"),
+            Column("attempts", Integer, nullable=False, server_default="0"),
+            Column("last_error", Text),
+            Column("created_at", TIMESTAMP, nullable=False, server_default=func.now()),
+            # No se reparte antes: reintentos con espera y reservas en curso
+            Column(
+                "available_at", TIMESTAMP, nullable=False, server_default=func.now()
+            ),
+        ]
+
+    # Caché de lecturas del catálogo
+    def _cached(self, key: tuple, loader):
+        self._sync_cache()
+        return self.cache.get_or_load(key, loader)
+
+    def cached(self, key: tuple, loader):
+        # Valores derivados del catálogo (p. ej. teclados): con la clave bajo el
+        # namespace de sus datos caen con la misma invalidación
+        return self._cached(key, loader)
+
+    @staticmethod
+    def _frozen_rows(result) -> Tuple[Mapping, ...]:
+        # Lo cacheado se comparte entre requests: filas de solo lectura
+        return tuple(MappingProxyType(row._asdict()) for row in result.fetchall())
+
+    def _sync_cache(self):
+        # Como mucho una consulta cada CACHE_SYNC_INTERVAL segundos por worker
+        now = time.monotonic()
+        if now - self._cache_synced_at < config.CACHE_SYNC_INTERVAL:
+            return
+        if not self._cache_sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._cache_synced_at = now
+            c = self.cache_invalidations
+            # Siempre del primario: una versión vieja de la réplica mantendría
+            # datos viejos otro TTL entero
+            with self.engine.connect() as connection:
+                server_now = connection.execute(select(func.now())).scalar()
+                if self._cache_seen_at is None:
+                    # Arranque: la caché está vacía, basta con fijar el punto
+                    self._cache_seen_at = server_now
+                    return
+                # Margen de un intervalo: una invalidación con hora anterior
+                # puede confirmarse después de la consulta previa
+                margin = timedelta(seconds=config.CACHE_SYNC_INTERVAL)
+                query = select(c.c.namespace, c.c.ident, c.c.version).where(
+                    c.c.updated_at > self._cache_seen_at - margin
+                )
+                rows = connection.execute(query).fetchall()
+            versions = {}
+            for namespace, ident, version in rows:
+                key = (namespace, ident)
+                if self._cache_versions.get(key) != version:
+                    self.cache.invalidate(namespace, *json.loads(ident))
+                    self._invalidated_at[namespace] = time.monotonic()
+                versions[key] = version
+            # Solo las del margen: no crece con cada clave invalidada
+            self._cache_versions = versions
+            self._cache_seen_at = server_now
+        finally:
+            self._cache_sync_lock.release()
+
+    def _invalidate(self, namespace: str, *ident):
+        # Local al momento; los demás workers se avisan tras el commit
+        self.cache.invalidate(namespace, *ident)
+        self._invalidated_at[namespace] = time.monotonic()
+        self.session.info.setdefault("cache_invalidations", set()).add(
+            (namespace, *ident)
+        )
+
+    def _apply_invalidations(self, session):
+        keys = session.info.pop("cache_invalidations", ())
+        if not keys:
+            return
+        # Otro request pudo recargar datos viejos antes del commit
+        for key in keys:
+            self.cache.invalidate(*key)
+        self._publish_invalidations(keys)
+
+    def _discard_invalidations(self, session):
+        session.info.pop("cache_invalidations", None)
+
+    def _publish_invalidations(self, keys):
+        # Transacción corta aparte, ya confirmada la escritura: los escritores
+        # del mismo namespace no esperan por el bloqueo de esta fila hasta su
+        # commit. Orden fijo para que dos lotes no se bloqueen en cruz
+        c = self.cache_invalidations
+        rows = sorted({(key[0], json.dumps(list(key[1:]))) for key in keys})
+        query = pg_insert(c).values(
+            [{"namespace": namespace, "ident": ident} for namespace, ident in rows]
+        )
+        query = query.on_conflict_do_update(
+            index_elements=[c.c.namespace, c.c.ident],
+            set_={"version": c.c.version + 1, "updated_at": func.now()},
+        ).returning(c.c.namespace, c.c.ident, c.c.version)
+        try:
+            with self.engine.begin() as connection:
+                published = connection.execute(query).fetchall()
+        except Exception as e:
+            # Lo escrito ya está confirmado: los demás workers lo verán al
+            # vencer el TTL
+            logger.error(f"No se pudo publicar la invalidación de caché: {e}")
+            return
+        # La propia no hace falta aplicarla otra vez al sincronizar
+        for namespace, ident, version in published:
+            self._cache_versions[(namespace, ident)] = version
+
+    # Carga masiva por clave natural: solo se escriben las filas que cambian
+    def _bulk_upsert(
+        self,
+        table: Table,
+        rows: List[Dict],
+        key: List[str],
+        extra: Optional[Dict] = None,
+        batch_size: int = 1000,
+        index_where=None,
+        touched: Optional[str] = None,
+    ) -> Dict:
+        # Una fila por clave: ON CONFLICT no puede tocar la misma fila dos veces
+        unique_rows = {tuple(row[column] for column in key): row for row in rows}
+        # Un lote multi-VALUES necesita las mismas columnas en todas sus filas
+        groups: Dict[tuple, List[Dict]] = {}
+        for row in unique_rows.values():
+            groups.setdefault(tuple(row), []).append(row)
+        batches = [
+            group[start : start + batch_size]
+            for group in groups.values()
+            for start in range(0, len(group), batch_size)
+        ]
+        inserted = updated = 0
+        touched_values = set()
+        for batch in batches:
+            query = pg_insert(table).values(batch)
+            columns = [column for column in batch[0] if column not in key]
+            if columns:
+                query = query.on_conflict_do_update(
+                    index_elements=[table.c[column] for column in key],
+                    index_where=index_where,
+                    set_={
+                        **{column: query.excluded[column] for column in columns},
+                        **(extra or {}),
+                    },
+                    where=or_(
+                        *[
+                            table.c[column].is_distinct_from(query.excluded[column])
+                            for column in columns
+                        ]
+                    ),
+                )
+            else:
+                query = query.on_conflict_do_nothing(
+                    index_elements=[table.c[column] for column in key],
+                    index_where=index_where,
+                )
+            # xmax = 0 solo en las filas recién insertadas
+            query = query.returning(
+                *table.primary_key.columns,
+                (literal_column("xmax") == 0).label("inserted"),
+                *([table.c[touched].label("touched")] if touched else []),
+            )
+            for row in self.session.execute(query).fetchall():
+                if row.inserted:
+                    inserted += 1
+                else:
+                    updated += 1
+                if touched:
+                    touched_values.add(row.touched)
+        return {
+            "inserted": inserted,
+            "updated": updated,
+            "unchanged": len(unique_rows) - inserted - updated,
+            # Valores de la columna `touched` en las filas escritas
+            **({"touched": touched_values} if touched else {}),
+        }
+
+    # Exposición por opción, en la misma sentencia o transacción que la apuesta
+    def _option_cap(self):
+        amount_type = self.option_exposure.c.liability.type
+        return func.coalesce(
+            self.match_bet_options.c.max_liability,
+            literal(config.EXPOSURE_MAX_LIABILITY, amount_type),
+        )
+
+    def _exposure_fits(self, option_id, liability, cap):
+        current = (
+            select(self.option_exposure.c.liability)
+            .where(self.option_exposure.c.option_id == option_id)
+            .scalar_subquery()
+        )
+        return cap.is_(None) | (func.coalesce(current, 0) + liability <= cap)
+
+    def _exposure_ctes(self, source):
+        # source: option_id, match_id, total_staked, liability, bets_count,
+        # max_liability
+        e = self.option_exposure
+        options = self.match_bet_options
+        query = pg_insert(e).from_select(
+            [
+                "option_id",
+                "match_id",
+                "total_staked",
+                "liability",
+                "bets_count",
+                "max_liability",
+            ],
+            source,
+        )
+        excluded = query.excluded
+        where = None
+        if config.EXPOSURE_CAP_ACTION == "reject":
+            # Se vuelve a comprobar con la fila bloqueada por si hubo carrera
+            where = excluded.max_liability.is_(None) | (
+                e.c.liability + excluded.liability <= excluded.max_liability
+            )
+        query = query.on_conflict_do_update(
+            index_elements=[e.c.option_id],
+            set_={
+                "total_staked": e.c.total_staked + excluded.total_staked,
+                "liability": e.c.liability + excluded.liability,
+                "bets_count": e.c.bets_count + excluded.bets_count,
+                "max_liability": excluded.max_liability,
+                "updated_at": func.now(),
+            },
+            where=where,
+        )
+        exposure = query.returning(e.c.option_id, e.c.liability).cte("exposure")
+
+        # Con "suspend" la apuesta que alcanza el tope entra y la opción se cierra
+        suspend = None
+        if config.EXPOSURE_CAP_ACTION == "suspend":
+            suspend = (
+                update(options)
+                .where(options.c.option_id == exposure.c.option_id)
+                .where(exposure.c.liability >= self._option_cap())
+                .values(is_active=False)
+                .returning(options.c.match_id)
+                .cte("suspend")
+            )
+        return exposure, suspend
+
+    def _add_exposure(self, option_id: int, amount, potential_win):
+        options = self.match_bet_options
+        amount_type = self.option_exposure.c.liability.type
+        liability = literal(potential_win, amount_type)
+        source = select(
+            options.c.option_id,
+            options.c.match_id,
+            literal(amount, amount_type),
+            liability,
+            literal(1),
+            self._option_cap(),
+        ).where(options.c.option_id == option_id)
+        if config.EXPOSURE_CAP_ACTION == "reject":
+            source = source.where(
+                self._exposure_fits(options.c.option_id, liability, self._option_cap())
+            )
+        exposure, suspend = self._exposure_ctes(source)
+        query = select(exposure.c.option_id)
+        if suspend is not None:
+            query = query.add_columns(
+                select(suspend.c.match_id).scalar_subquery().label("suspended")
+            )
+        row = self.session.execute(query).one_or_none()
+        if row is None:
+            raise ExposureLimitExceeded(
+                f"La opción {option_id} superaría su tope de riesgo"
+            )
+        if suspend is not None and row.suspended:
+            logger.warning(f"Opción {option_id} suspendida por tope de riesgo")
+            self._invalidate("bet_options", row.suspended)
+
+    def _release_exposure(self, option_id: int, potential_win, won: bool):
+        # La apuesta deja de ser riesgo; si ganó pasa a lo pagado
+        e = self.option_exposure
+        query = (
+            update(e)
+            .where(e.c.option_id == option_id)
+            .values(
+                liability=e.c.liability - potential_win,
+                payout=e.c.payout + (potential_win if won else 0),
+                updated_at=func.now(),
+            )
+        )
+        self.session.execute(query)
+
+    def get_match_exposure(self, match_id: int) -> Dict:
+        logger.debug("get_match_exposure")
+        e = self.option_exposure
+        options = self.match_bet_options
+        query = (
+            select(e, options.c.prediction, options.c.is_active)
+            .join(options, options.c.option_id == e.c.option_id)
+            .where(e.c.match_id == match_id)
+            .order_by(e.c.liability.desc())
+        )
+        rows = self._rows(query)
+        return {
+            "match_id": match_id,
+            "total_staked": sum(row["total_staked"] for row in rows),
+            "liability": sum(row["liability"] for row in rows),
+            "payout": sum(row["payout"] for row in rows),
+            "options": rows,
+        }
+
+    def get_top_exposures(
+        self, limit: int = 20, mode: RowMode = RowMode.DICT
+    ) -> Iterable:
+        logger.debug("get_top_exposures")
+        e = self.option_exposure
+        options = self.match_bet_options
+        query = (
+            select(e, options.c.prediction, options.c.is_active)
+            .join(options, options.c.option_id == e.c.option_id)
+            .order_by(e.c.liability.desc())
+            .limit(limit)
+        )
+        return self._rows(query, mode)
+
+    # Estadísticas por usuario, actualizadas en la misma transacción que la apuesta
+    def _period_start(self, window: StatsWindow):
+        if window == StatsWindow.DAY:
+            return func.current_date()
+        if window == StatsWindow.WEEK:
+            return cast(func.date_trunc("week", func.current_date()), Date)
+        return literal(date(1970, 1, 1), Date)
+
+    def _stats_source(
+        self, user_id: int, staked=0, won=0, bets_count=0, win_count=0, streak=0
+    ):
+        amount_type = self.user_stats.c.total_staked.type
+        return select(
+            literal(user_id, BigInteger).label("user_id"),
+            literal(staked, amount_type).label("staked"),
+            literal(won, amount_type).label("won"),
+            literal(bets_count).label("bets_count"),
+            literal(win_count).label("win_count"),
+            literal(streak).label("streak"),
+        ).subquery()
+
+    def _user_stats_upsert(self, source):
+        # source: user_id, staked, won, bets_count, win_count y streak: la racha
+        # final del lote, con signo. Si es más corta que el lote, hubo un
+        # resultado distinto antes y la racha empieza de nuevo
+        stats = self.user_stats
+        # La fuente aparece una sola vez; las ventanas son tres filas constantes
+        windows = union_all(
+            *[
+                select(
+                    literal(window.value).label("period"),
+                    self._period_start(window).label("period_start"),
+                )
+                for window in StatsWindow
+            ]
+        ).subquery("windows")
+        rows = select(
+            windows.c.period,
+            windows.c.period_start,
+            source.c.user_id,
+            source.c.staked,
+            source.c.won,
+            source.c.won - source.c.staked,
+            source.c.bets_count,
+            source.c.win_count,
+            source.c.streak,
+        ).select_from(source.join(windows, true()))
+        query = pg_insert(stats).from_select(
+            [
+                "period",
+                "period_start",
+                "user_id",
+                "total_staked",
+                "total_won",
+                "net_profit",
+                "bets_count",
+                "win_count",
+                "current_streak",
+            ],
+            rows,
+        )
+        excluded = query.excluded
+        return query.on_conflict_do_update(
+            index_elements=[stats.c.period, stats.c.period_start, stats.c.user_id],
+            set_={
+                "total_staked": stats.c.total_staked + excluded.total_staked,
+                "total_won": stats.c.total_won + excluded.total_won,
+                "net_profit": stats.c.net_profit + excluded.net_profit,
+                "bets_count": stats.c.bets_count + excluded.bets_count,
+                "win_count": stats.c.win_count + excluded.win_count,
+                "current_streak": case(
+                    (excluded.current_streak == 0, stats.c.current_streak),
+                    (
+                        func.abs(excluded.current_streak) < excluded.bets_count,
+                        excluded.current_streak,
+                    ),
+                    (
+                        excluded.current_streak > 0,
+                        func.greatest(stats.c.current_streak, 0)
+                        + excluded.current_streak,
+                    ),
+                    else_=func.least(stats.c.current_streak, 0)
+                    + excluded.current_streak,
+                ),
+                "updated_at": func.now(),
+            },
+        )
+
+    def purge_stats_windows(self) -> int:
+        # Los cubos de días y semanas ya cerrados no los lee nadie
+        logger.debug("purge_stats_windows")
+        stats = self.user_stats
+        query = delete(stats).where(
+            or_(
+                *[
+                    (stats.c.period == window.value)
+                    & (stats.c.period_start < self._period_start(window))
+                    for window in (StatsWindow.DAY, StatsWindow.WEEK)
+                ]
+            )
+        )
+        result = self.session.execute(query)
+        self._commit()
+        logger.info(f"{result.rowcount} estadísticas de periodos cerrados purgadas")
+        return result.rowcount
+
+    def get_leaderboard(
+        self,
+        window: StatsWindow = StatsWindow.ALL,
+        limit: int = 10,
+        mode: RowMode = RowMode.DICT,
+    ) -> Iterable:
+        logger.debug("get_leaderboard")
+        query = (
+            select(
+                self.user_stats.c.user_id,
+                self.users.c.username,
+                self.users.c.first_name,
+                self.user_stats.c.net_profit,
+                self.user_stats.c.total_won,
+                self.user_stats.c.win_count,
+                self.user_stats.c.current_streak,
+            )
+            .join(self.users, self.users.c.user_id == self.user_stats.c.user_id)
+            .where(self.user_stats.c.period == window.value)
+            .where(self.user_stats.c.period_start == self._period_start(window))
+            .order_by(self.user_stats.c.net_profit.desc())
+            .limit(limit)
+        )
+        return self._rows(query, mode, self.read_session)
+
+    # CRUD para Users
+    def create_user(self, user_data: Dict) -> int:
+        query = insert(self.users).values(user_data)
+        result = self.session.execute(query)
+        self._commit()
+        return result.inserted_primary_key[0]
+
+    def get_user(self, user_id: int) -> Optional[Dict]:
+        logger.debug("get_user")
+        result = self.session.execute(self._user_query, {"user_id": user_id})
+        return result.fetchone()._asdict() if result.rowcount else None
+
+    def update_user(self, user_id: int, user_data: Dict) -> bool:
+        logger.debug("update_user")
+        query = (
+            update(self.users).where(self.users.c.user_id == user_id).values(user_data)
+        )
+        result = self.session.execute(query)
+        self._commit()
+        return result.rowcount > 0
+
+    def delete_user(self, user_id: int) -> bool:
+        logger.debug("delete_user")
+        query = delete(self.users).where(self.users.c.user_id == user_id)
+        result = self.session.execute(query)
+        self._commit()
+        return result.rowcount > 0
+
+    def update_user_balance(self, user_id: int, amount: float) -> bool:
+        logger.debug("update_user_balance")
+        query = (
+            update(self.users)
+            .where(self.users.c.user_id == user_id)
+            .values(balance=self.users.c.balance + amount)
+        )
+        result = self.session.execute(query)
+        self._commit()
+        return result.rowcount > 0
+
+    # CRUD para Sports
+    def create_sport(self, sport_data: Dict) -> int:
+        logger.debug("create_sport")
+        query = insert(self.sports).values(sport_data)
+        result = self.session.execute(query)
+        self._invalidate("sports")
+        self._commit()
+        return result.inserted_primary_key[0]
+
+    def get_sport(self, sport_id: int) -> Optional[Dict]:
+        logger.debug("get_sport")
+        query = self.sports.select().where(self.sports.c.sport_id == sport_id)
+        result = self._catalog_session("sports").execute(query)
+        return result.fetchone()._asdict() if result.rowcount else None
+
+    def get_all_active_sports(self) -> Sequence[Mapping]:
+        logger.debug("get_all_active_sports")
+
+        def load():
+            query = self.sports.select().where(self.sports.c.is_active)
+            return self._frozen_rows(self._catalog_session("sports").execute(query))
+
+        return self._cached(("sports",), load)
+
+    def update_sport(self, sport_id: int, sport_data: Dict) -> bool:
+        logger.debug("update_sport")
+        query = (
+            update(self.sports)
+            .where(self.sports.c.sport_id == sport_id)
+            .values(sport_data)
+        )
+        result = self.session.execute(query)
+        self._invalidate("sports")
+        self._commit()
+        return result.rowcount > 0
+
+    def delete_sport(self, sport_id: int) -> bool:
+        logger.debug("delete_sport")
+        query = delete(self.sports).where(self.sports.c.sport_id == sport_id)
+        result = self.session.execute(query)
+        # El borrado en cascada alcanza competiciones, partidos y opciones
+        self._invalidate("sports")
+        self._invalidate("competitions", sport_id)
+        self._invalidate("matches")
+        self._invalidate("bet_options")
+        self._commit()
+        return result.rowcount > 0
+
+    # CRUD para Competitions
+    def create_competition(self, competition_data: Dict) -> int:
+        logger.debug("create_competition")
+        query = insert(self.competitions).values(competition_data)
+        result = self.session.execute(query)
+        self._invalidate("competitions", competition_data["sport_id"])
+        self._commit()
+        return result.inserted_primary_key[0]
+
+    def get_competition(self, competition_id: int) -> Optional[Dict]:
+        logger.debug("get_competition")
+        query = self.competitions.select().where(
+            self.competitions.c.competition_id == competition_id
+        )
+        result = self._catalog_session("competitions").execute(query)
+        return result.fetchone()._asdict() if result.rowcount else None
+
+    def get_competitions_by_sport(self, sport_id: int) -> Sequence[Mapping]:
+        logger.debug("get_competitions_by_sport")
+
+        def load():
+            query = self.competitions.select().where(
+                self.competitions.c.sport_id == sport_id
+            )
+            return self._frozen_rows(
+                self._catalog_session("competitions").execute(query)
+            )
+
+        return self._cached(("competitions", sport_id), load)
 
     def update_competition(self, competition_id: int, competition_data: Dict) -> bool:
         logger.debug("update_competition")
@@ -354,29 +1665,44 @@ class DatabaseManager:
             update(self.competitions)
             .where(self.competitions.c.competition_id == competition_id)
             .values(competition_data)
+            .returning(self.competitions.c.sport_id)
         )
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.rowcount > 0
+        sport_id = self.session.execute(query).scalar()
+        if "sport_id" in competition_data:
+            # Se desconoce el deporte anterior
+            self._invalidate("competitions")
+        elif sport_id is not None:
+            self._invalidate("competitions", sport_id)
+        self._commit()
+        return sport_id is not None
 
     def delete_competition(self, competition_id: int) -> bool:
         logger.debug("delete_competition")
-        query = delete(self.competitions).where(
-            self.competitions.c.competition_id == competition_id
+        query = (
+            delete(self.competitions)
+            .where(self.competitions.c.competition_id == competition_id)
+            .returning(self.competitions.c.sport_id)
         )
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.rowcount > 0
+        sport_id = self.session.execute(query).scalar()
+        if sport_id is not None:
+            self._invalidate("competitions", sport_id)
+            self._invalidate("matches", competition_id)
+            self._invalidate("bet_options")
+        self._commit()
+        return sport_id is not None
 
     # CRUD para Matches
     def create_match(self, match_data: Dict) -> int:
         logger.debug("create_match")
         query = insert(self.matches).values(match_data)
         result = self.session.execute(query)
-        self.session.commit()
+        self._invalidate("matches", match_data["competition_id"])
+        self._commit()
         return result.inserted_primary_key[0]
 
-    def get_upcoming_matches(self, limit: int = 10) -> List[Dict]:
+    def get_upcoming_matches(
+        self, limit: int = 10, mode: RowMode = RowMode.DICT
+    ) -> Iterable:
         logger.debug("get_upcoming_matches")
         query = (
             self.matches.select()
@@ -384,9 +1710,7 @@ class DatabaseManager:
             .order_by(self.matches.c.match_date)
             .limit(limit)
         )
-        logger.debug(query)
-        result = self.session.execute(query)
-        return [row._asdict() for row in result.fetchall()]
+        return self._rows(query, mode, self.read_session)
 
     def update_match(self, match_id: int, match_data: Dict) -> bool:
         logger.debug("update_match")
@@ -395,20 +1719,27 @@ class DatabaseManager:
             update(self.matches)
             .where(self.matches.c.match_id == match_id)
             .values(match_data)
+            .returning(self.matches.c.competition_id)
         )
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.rowcount > 0
+        competition_id = self.session.execute(query).scalar()
+        if "competition_id" in match_data:
+            # Se desconoce la competición anterior
+            self._invalidate("matches")
+        elif competition_id is not None:
+            self._invalidate("matches", competition_id)
+        self._commit()
+        return competition_id is not None
 
     def get_match(self, match_id: int) -> Optional[Dict]:
         logger.debug("get_match")
-        query = self.matches.select().where(self.matches.c.match_id == match_id)
-        result = self.session.execute(query)
+        result = self._catalog_session("matches").execute(
+            self._match_query, {"match_id": match_id}
+        )
         return result.fetchone()._asdict() if result.rowcount else None
 
     def get_matches_by_competition(
-        self, competition_id: int, limit: int = 50
-    ) -> List[Dict]:
+        self, competition_id: int, limit: int = 50, mode: RowMode = RowMode.DICT
+    ) -> Iterable:
         logger.debug("get_matches_by_competition")
         query = (
             self.matches.select()
@@ -416,8 +1747,40 @@ class DatabaseManager:
             .order_by(self.matches.c.match_date)
             .limit(limit)
         )
-        result = self.session.execute(query)
-        return [row._asdict() for row in result.fetchall()]
+        return self._rows(query, mode, self.read_session)
+
+    def get_open_matches(self, competition_id: int) -> Sequence[Mapping]:
+        logger.debug("get_open_matches")
+
+        # Los que aún admiten apuestas; el TTL acota los que empiezan entretanto
+        def load():
+            query = (
+                self.matches.select()
+                .where(self.matches.c.competition_id == competition_id)
+                .where(self.matches.c.status == "pending")
+                .where(self.matches.c.match_date > func.now())
+                .order_by(self.matches.c.match_date, self.matches.c.match_id)
+            )
+            return self._frozen_rows(self._catalog_session("matches").execute(query))
+
+        return self._cached(("matches", competition_id), load)
+
+    def upsert_matches(self, rows: List[Dict], batch_size: int = 1000) -> Dict:
+        logger.debug("upsert_matches")
+        with self.transaction():
+            counts = self._bulk_upsert(
+                self.matches,
+                rows,
+                ["competition_id", "team_home", "team_away"],
+                extra={"updated_at": func.now()},
+                batch_size=batch_size,
+                index_where=self.matches.c.status == "pending",
+                touched="competition_id",
+            )
+            for competition_id in counts.pop("touched"):
+                self._invalidate("matches", competition_id)
+        logger.info(f"Partidos cargados: {counts}")
+        return counts
 
     def set_match_result(self, match_id: int, result: str) -> bool:
         logger.debug("set_match_result")
@@ -425,33 +1788,384 @@ class DatabaseManager:
             update(self.matches)
             .where(self.matches.c.match_id == match_id)
             .values(result=result, status="finished", updated_at=func.now())
+            .returning(self.matches.c.competition_id)
+        )
+        competition_id = self.session.execute(query).scalar()
+        if competition_id is not None:
+            self._invalidate("matches", competition_id)
+        self._commit()
+        return competition_id is not None
+
+    def settle_match(
+        self, match_id: int, winning_option_ids: List[int], result: str = None
+    ) -> Optional[Dict]:
+        logger.debug("settle_match")
+        started = time.perf_counter()
+        try:
+            with self.transaction():
+                # 1. Marcar como ganadas o perdidas las apuestas pendientes del
+                # partido. Premios, estadísticas, riesgo y avisos salen de las
+                # filas liquidadas en la misma sentencia, sin pasar ids por Python
+                match_options = select(self.match_bet_options.c.option_id).where(
+                    self.match_bet_options.c.match_id == match_id
+                )
+                status_type = self.bets.c.status.type
+                settled_bets = (
+                    update(self.bets)
+                    .where(self.bets.c.status == BetStatus.PENDING)
+                    .where(self.bets.c.option_id.in_(match_options))
+                    .values(
+                        status=case(
+                            (
+                                self.bets.c.option_id.in_(winning_option_ids),
+                                cast(literal(BetStatus.WIN, status_type), status_type),
+                            ),
+                            else_=cast(
+                                literal(BetStatus.LOSE, status_type), status_type
+                            ),
+                        ),
+                        settled_at=func.now(),
+                    )
+                    .returning(
+                        self.bets.c.bet_id,
+                        self.bets.c.user_id,
+                        self.bets.c.option_id,
+                        self.bets.c.amount,
+                        self.bets.c.potential_win,
+                        self.bets.c.status,
+                    )
+                    .cte("settled_bets")
+                )
+
+                # Ya no queda nada pendiente en el partido: el riesgo pasa a
+                # cero y lo ganado a lo pagado
+                e = self.option_exposure
+                paid = (
+                    select(func.coalesce(func.sum(settled_bets.c.potential_win), 0))
+                    .where(settled_bets.c.status == BetStatus.WIN)
+                    .where(settled_bets.c.option_id == e.c.option_id)
+                    .scalar_subquery()
+                )
+                exposure_query = (
+                    update(e)
+                    .where(e.c.match_id == match_id)
+                    .values(
+                        liability=0, payout=e.c.payout + paid, updated_at=func.now()
+                    )
+                    .returning(e.c.option_id)
+                )
+                bets = self._apply_settlement(
+                    settled_bets,
+                    settled_bets.c.bet_id,
+                    "Ganancia apuesta #",
+                    "bet_settled",
+                    exposure_query,
+                )
+
+                # 2. Resolver las selecciones de combinadas de este partido. Va
+                # en otra sentencia: un usuario puede cobrar apuesta y combinada
+                # y la misma fila de users no se actualiza dos veces en una
+                settled_parlays = self._settle_parlay_legs(
+                    match_options, winning_option_ids
+                )
+                parlays = self._apply_settlement(
+                    settled_parlays,
+                    settled_parlays.c.parlay_id,
+                    "Ganancia combinada #",
+                    "parlay_settled",
+                )
+
+                # 3. Cerrar el partido
+                match_data = {"status": "finished", "updated_at": func.now()}
+                if result is not None:
+                    match_data["result"] = result
+                match_query = (
+                    update(self.matches)
+                    .where(self.matches.c.match_id == match_id)
+                    .values(match_data)
+                    .returning(self.matches.c.competition_id)
+                )
+                competition_id = self.session.execute(match_query).scalar()
+                if competition_id is not None:
+                    self._invalidate("matches", competition_id)
+        except Exception as e:
+            logger.error(f"Error settling match: {e}")
+            return None
+
+        report = {
+            "match_id": match_id,
+            "settled": bets.settled,
+            "won": bets.won,
+            "lost": bets.settled - bets.won,
+            "parlays_settled": parlays.settled,
+            "parlays_won": parlays.won,
+            "elapsed": time.perf_counter() - started,
+        }
+        logger.info(
+            f"Partido #{match_id} liquidado: {report['settled']} apuestas "
+            f"({report['won']} ganadas, {report['lost']} perdidas) y "
+            f"{report['parlays_settled']} combinadas en {report['elapsed']:.3f}s"
+        )
+        return report
+
+    def _settle_parlay_legs(self, match_options, winning_option_ids: List[int]):
+        # Solo se tocan las selecciones del partido y sus combinadas abiertas
+        legs = self.parlay_legs
+        parlays = self.parlays
+        status_type = parlays.c.status.type
+
+        def status(value):
+            return cast(literal(value, status_type), status_type)
+
+        resolved_legs = (
+            update(legs)
+            .where(legs.c.status == BetStatus.PENDING)
+            .where(legs.c.option_id.in_(match_options))
+            .values(
+                status=case(
+                    (legs.c.option_id.in_(winning_option_ids), status(BetStatus.WIN)),
+                    else_=status(BetStatus.LOSE),
+                ),
+                settled_at=func.now(),
+            )
+            .returning(legs.c.parlay_id, legs.c.status)
+            .cte("resolved_legs")
+        )
+        resolved = (
+            select(
+                resolved_legs.c.parlay_id,
+                func.count().label("resolved"),
+                func.count()
+                .filter(resolved_legs.c.status == BetStatus.LOSE)
+                .label("lost"),
+            )
+            .group_by(resolved_legs.c.parlay_id)
+            .cte("resolved")
+        )
+
+        # Una selección perdida liquida la combinada; si no, la última que llega
+        remaining = parlays.c.pending_legs - resolved.c.resolved
+        settles = (resolved.c.lost > 0) | (remaining == 0)
+        query = (
+            update(parlays)
+            .where(parlays.c.parlay_id == resolved.c.parlay_id)
+            .where(parlays.c.status == BetStatus.PENDING)
+            .values(
+                pending_legs=remaining,
+                status=case(
+                    (resolved.c.lost > 0, status(BetStatus.LOSE)),
+                    (remaining == 0, status(BetStatus.WIN)),
+                    else_=status(BetStatus.PENDING),
+                ),
+                settled_at=case((settles, func.now()), else_=parlays.c.settled_at),
+            )
+            .returning(
+                parlays.c.parlay_id,
+                parlays.c.user_id,
+                parlays.c.amount,
+                parlays.c.potential_win,
+                parlays.c.status,
+            )
+            .cte("updated_parlays")
+        )
+        return (
+            select(query)
+            .where(query.c.status != BetStatus.PENDING)
+            .cte("settled_parlays")
+        )
+
+    def _apply_settlement(self, settled, id_column, description, event_type, *extra):
+        # settled: CTE con las filas recién liquidadas (id, user_id, amount,
+        # potential_win, status). Estadísticas, premios, movimientos y avisos
+        # se escriben en una sola sentencia a partir de él
+        won = settled.c.status == BetStatus.WIN
+
+        # Premios agrupados por usuario
+        winnings = (
+            select(settled.c.user_id, func.sum(settled.c.potential_win).label("total"))
+            .where(won)
+            .group_by(settled.c.user_id)
+            .subquery()
+        )
+        credit = (
+            update(self.users)
+            .where(self.users.c.user_id == winnings.c.user_id)
+            .values(balance=self.users.c.balance + winnings.c.total)
+            .returning(self.users.c.user_id)
+        )
+
+        # Una transacción de ganancia por apuesta
+        type_type = self.transactions.c.type.type
+        ledger = (
+            insert(self.transactions)
+            .from_select(
+                ["user_id", "amount", "type", "status", "description"],
+                select(
+                    settled.c.user_id,
+                    settled.c.potential_win,
+                    cast(literal(TransactionType.WIN, type_type), type_type),
+                    literal("completed"),
+                    func.concat(description, id_column),
+                ).where(won),
+            )
+            .returning(self.transactions.c.transaction_id)
+        )
+
+        stats = self._user_stats_upsert(
+            self._settled_stats_source(settled, id_column)
+        ).returning(self.user_stats.c.user_id)
+        events = self._settled_events(settled, id_column, event_type).returning(
+            self.outbox.c.event_id
+        )
+
+        # Se referencian todos: SQLAlchemy solo escribe los CTE que se usan
+        writes = [
+            statement.cte(f"{event_type}_{index}")
+            for index, statement in enumerate([stats, credit, ledger, events, *extra])
+        ]
+        query = select(
+            select(func.count())
+            .select_from(settled)
+            .scalar_subquery()
+            .label("settled"),
+            select(func.count())
+            .select_from(settled)
+            .where(won)
+            .scalar_subquery()
+            .label("won"),
+            *[
+                select(func.count()).select_from(cte).scalar_subquery()
+                for cte in writes
+            ],
+        )
+        return self.session.execute(query).one()
+
+    # Outbox: los avisos se escriben con el movimiento y se envían después
+    def _enqueue_event(self, user_id: int, event_type: str, payload: Dict):
+        query = insert(self.outbox).values(
+            user_id=user_id, event_type=event_type, payload=payload
+        )
+        self.session.execute(query)
+
+    def _outbox_insert(self, source, event_type: str, *fields):
+        payload = func.json_build_object(
+            *[part for field in fields for part in (literal(field.name), field)]
+        )
+        return insert(self.outbox).from_select(
+            ["user_id", "event_type", "payload"],
+            select(source.c.user_id, literal(event_type), payload),
+        )
+
+    def _enqueue_from(self, source, event_type: str, *fields):
+        self.session.execute(self._outbox_insert(source, event_type, *fields))
+
+    def _enqueue_transaction_events(self, ids: List[int], event_type: str):
+        if not ids:
+            return
+        t = self.transactions
+        source = t.select().where(t.c.transaction_id.in_(ids)).subquery()
+        self._enqueue_from(
+            source,
+            event_type,
+            source.c.transaction_id,
+            source.c.type,
+            source.c.amount,
+        )
+
+    def _settled_events(self, source, id_column, event_type: str):
+        return self._outbox_insert(
+            source,
+            event_type,
+            id_column,
+            source.c.status,
+            source.c.amount,
+            source.c.potential_win,
+        )
+
+    def _enqueue_settled_events(self, table: Table, ids: List[int], event_type: str):
+        if not ids:
+            return
+        id_column = table.primary_key.columns.values()[0]
+        source = table.select().where(id_column.in_(ids)).subquery()
+        self.session.execute(
+            self._settled_events(source, source.c[id_column.name], event_type)
+        )
+
+    def _settled_stats_source(self, source, id_column):
+        # Todo se cuenta al liquidar: lo apostado y lo ganado caen en la misma
+        # ventana aunque la apuesta se hiciera otro día
+        won = source.c.status == BetStatus.WIN
+        results = select(
+            source.c.user_id,
+            id_column.label("row_id"),
+            source.c.amount,
+            source.c.potential_win,
+            won.label("won"),
+            func.first_value(won)
+            .over(partition_by=source.c.user_id, order_by=id_column.desc())
+            .label("last_won"),
+        ).subquery()
+        # La racha es el tramo final con el mismo resultado que la última
+        # apuesta, en orden de apuesta: lo anterior al último resultado distinto no cuenta
+        breaks = select(
+            results,
+            func.max(case((results.c.won != results.c.last_won, results.c.row_id)))
+            .over(partition_by=results.c.user_id)
+            .label("last_break"),
+        ).subquery()
+        streak = func.count().filter(
+            breaks.c.row_id > func.coalesce(breaks.c.last_break, 0)
+        )
+        return (
+            select(
+                breaks.c.user_id,
+                func.sum(breaks.c.amount).label("staked"),
+                func.coalesce(
+                    func.sum(breaks.c.potential_win).filter(breaks.c.won), 0
+                ).label("won"),
+                func.count().label("bets_count"),
+                func.count().filter(breaks.c.won).label("win_count"),
+                case((func.bool_or(breaks.c.last_won), streak), else_=-streak).label(
+                    "streak"
+                ),
+            )
+            .group_by(breaks.c.user_id)
+            .cte("stats_source")
         )
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.rowcount > 0
 
     def delete_match(self, match_id: int) -> bool:
         logger.debug("delete_match")
-        query = delete(self.matches).where(self.matches.c.match_id == match_id)
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.rowcount > 0
+        query = (
+            delete(self.matches)
+            .where(self.matches.c.match_id == match_id)
+            .returning(self.matches.c.competition_id)
+        )
+        competition_id = self.session.execute(query).scalar()
+        if competition_id is not None:
+            self._invalidate("matches", competition_id)
+        self._invalidate("bet_options", match_id)
+        self._commit()
+        return competition_id is not None
 
     # CRUD para BetTypes
     def create_bet_type(self, bet_type_data: Dict) -> int:
         logger.debug("create_bet_type")
         query = insert(self.bet_types).values(bet_type_data)
         result = self.session.execute(query)
-        self.session.commit()
+        self._invalidate("bet_types")
+        self._commit()
         return result.inserted_primary_key[0]
 
-    def get_all_bet_types(self, active_only: bool = True) -> List[Dict]:
+    def get_all_bet_types(self, active_only: bool = True) -> Sequence[Mapping]:
         logger.debug("get_all_bet_types")
-        query = self.bet_types.select()
-        if active_only:
-            query = query.where(self.bet_types.c.is_active)
-        result = self.session.execute(query)
-        return [row._asdict() for row in result.fetchall()]
+
+        def load():
+            query = self.bet_types.select()
+            if active_only:
+                query = query.where(self.bet_types.c.is_active)
+            return self._frozen_rows(self._catalog_session("bet_types").execute(query))
+
+        return self._cached(("bet_types", active_only), load)
 
     def update_bet_type(self, bet_type_id: int, bet_type_data: Dict) -> bool:
         logger.debug("update_bet_type")
@@ -461,7 +2175,8 @@ class DatabaseManager:
             .values(bet_type_data)
         )
         result = self.session.execute(query)
-        self.session.commit()
+        self._invalidate("bet_types")
+        self._commit()
         return result.rowcount > 0
 
     def delete_bet_type(self, bet_type_id: int) -> bool:
@@ -470,7 +2185,9 @@ class DatabaseManager:
             self.bet_types.c.bet_type_id == bet_type_id
         )
         result = self.session.execute(query)
-        self.session.commit()
+        self._invalidate("bet_types")
+        self._invalidate("bet_options")
+        self._commit()
         return result.rowcount > 0
 
     # CRUD para MatchBetOptions
@@ -478,20 +2195,49 @@ class DatabaseManager:
         logger.debug("create_match_bet_option")
         query = insert(self.match_bet_options).values(option_data)
         result = self.session.execute(query)
-        self.session.commit()
+        self._invalidate("bet_options", option_data["match_id"])
+        self._commit()
         return result.inserted_primary_key[0]
 
+    def upsert_bet_options(self, rows: List[Dict], batch_size: int = 1000) -> Dict:
+        logger.debug("upsert_bet_options")
+        with self.transaction():
+            counts = self._bulk_upsert(
+                self.match_bet_options,
+                rows,
+                ["match_id", "bet_type_id", "prediction"],
+                batch_size=batch_size,
+                touched="match_id",
+            )
+            # Solo los partidos cuyas cuotas cambiaron
+            for match_id in counts.pop("touched"):
+                self._invalidate("bet_options", match_id)
+        logger.info(f"Cuotas cargadas: {counts}")
+        return counts
+
     def get_bet_options_for_match(
         self, match_id: int, active_only: bool = True
-    ) -> List[Dict]:
+    ) -> Sequence[Mapping]:
         logger.debug("get_bet_option_for_match")
+
+        def load():
+            query = self._bet_options_query
+            if active_only:
+                query = self._active_bet_options_query
+            result = self._catalog_session("bet_options").execute(
+                query, {"match_id": match_id}
+            )
+            return self._frozen_rows(result)
+
+        return self._cached(("bet_options", match_id, active_only), load)
+
+    def get_bet_option(self, option_id: int) -> Optional[Dict]:
+        logger.debug("get_bet_option")
         query = self.match_bet_options.select().where(
-            self.match_bet_options.c.match_id == match_id
+            self.match_bet_options.c.option_id == option_id
         )
-        if active_only:
-            query = query.where(self.match_bet_options.c.is_active)
-        result = self.session.execute(query)
-        return [row._asdict() for row in result.fetchall()]
+        result = self._catalog_session("bet_options").execute(query)
+        return result.fetchone()._asdict() if result.rowcount else None
 
     def update_bet_option(self, option_id: int, bet_option_data: Dict) -> bool:
         logger.debug("update_bet_option")
@@ -499,69 +2245,83 @@ class DatabaseManager:
             update(self.match_bet_options)
             .where(self.match_bet_options.c.option_id == option_id)
             .values(bet_option_data)
+            .returning(self.match_bet_options.c.match_id)
         )
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.rowcount > 0
+        match_id = self.session.execute(query).scalar()
+        if "match_id" in bet_option_data:
+            self._invalidate("bet_options")
+        elif match_id is not None:
+            self._invalidate("bet_options", match_id)
+        self._commit()
+        return match_id is not None
 
     def delete_match_bet_option(self, option_id: int) -> bool:
         logger.debug("delete_match_bet_option")
-        query = delete(self.match_bet_options).where(
-            self.match_bet_options.c.option_id == option_id
+        query = (
+            delete(self.match_bet_options)
+            .where(self.match_bet_options.c.option_id == option_id)
+            .returning(self.match_bet_options.c.match_id)
         )
-        result = self.session.execute(query)
-        self.session.commit()
-        return result.rowcount > 0
+        match_id = self.session.execute(query).scalar()
+        if match_id is not None:
+            self._invalidate("bet_options", match_id)
+        self._commit()
+        return match_id is not None
 
     # CRUD para Transactions
     def create_transaction(self, transaction_data: Dict) -> int:
         logger.debug("create_transaction")
         query = insert(self.transactions).values(transaction_data)
         result = self.session.execute(query)
-        self.session.commit()
+        self._commit()
         return result.inserted_primary_key[0]
 
     def approve_transaction(self, transaction_id: int, admin_id: int) -> bool:
         logger.debug("approve_transaction")
         try:
-            # 1. Obtener la transacción
-            query = self.transactions.select().where(
-                self.transactions.c.transaction_id == transaction_id
-            )
-            transaction_result = self.session.execute(query)
-            transaction = transaction_result.fetchone()
-
-            if not transaction or transaction["status"] != "pending":
-                return False
-
-            # 2. Actualizar estado
-            update_query = (
-                update(self.transactions)
-                .where(self.transactions.c.transaction_id == transaction_id)
-                .values(status="approved", admin_id=admin_id, processed_at=func.now())
-            )
-            self.session.execute(update_query)
-
-            # 3. Si es depósito, acreditar saldo. Si es extracción retirar
-            if transaction["type"] == "deposit":
-                self.update_user_balance(transaction["user_id"], transaction["amount"])
-            elif transaction["type"] == "withdrawal":
-                user = self.get_user(transaction["user_id"])
-                if user["balance"] < transaction["amount"]:
-                    logger.warning(
-                        f"El usuario {user['name']} no tiene suficiente saldo para realizar la extracción. Balance: {user['balance']} Cantidad solicitada: {transaction['amount']}"
-                    )
-                    return False
+            with self.transaction():
+                # 1. Obtener y bloquear la transacción: dos admins no la aprueban a la vez
+                query = (
+                    self.transactions.select()
+                    .where(self.transactions.c.transaction_id == transaction_id)
+                    .with_for_update()
+                )
+                transaction_result = self.session.execute(query)
+                transaction = transaction_result.fetchone()
 
-                self.update_user_balance(transaction["user_id"], -transaction["amount"])
+                if not transaction or transaction.status != "pending":
+                    return False
 
-            self.session.commit()
+                # 2. Si es extracción, descontar solo si el saldo alcanza
+                if transaction.type == TransactionType.WITHDRAWAL:
+                    if not self._debit_withdrawal(
+                        transaction.user_id, transaction.amount
+                    ):
+                        logger.warning(
+                            f"El usuario {transaction.user_id} no tiene suficiente saldo para realizar la extracción. Cantidad solicitada: {transaction.amount}"
+                        )
+                        return False
+
+                # 3. Actualizar estado y dejar el aviso en el outbox
+                self._resolve_claimed([transaction_id], admin_id, "approved")
+
+                # 4. Si es depósito, acreditar saldo
+                if transaction.type == TransactionType.DEPOSIT:
+                    self.update_user_balance(transaction.user_id, transaction.amount)
             return True
         except Exception as e:
-            self.session.rollback()
             logger.error(f"Error approving transaction: {e}")
             return False
 
+    def _debit_withdrawal(self, user_id: int, amount) -> bool:
+        query = (
+            update(self.users)
+            .where(self.users.c.user_id == user_id)
+            .where(self.users.c.balance >= amount)
+            .values(balance=self.users.c.balance - amount)
+        )
+        return self.session.execute(query).rowcount > 0
+
     def get_transaction(self, transaction_id: int) -> Optional[Dict]:
         logger.debug("get_transaction")
         query = self.transactions.select().where(
@@ -570,34 +2330,174 @@ class DatabaseManager:
         result = self.session.execute(query)
         return result.fetchone()._asdict() if result.rowcount else None
 
-    def get_user_transactions(self, user_id: int, limit: int = 50) -> List[Dict]:
+    def get_user_transactions(
+        self, user_id: int, cursor: str = None, limit: int = 50
+    ) -> Page:
         logger.debug("get_user_transactions")
-        query = (
-            self.transactions.select()
-            .where(self.transactions.c.user_id == user_id)
-            .order_by(self.transactions.c.created_at.desc())
-            .limit(limit)
+        query = self.transactions.select().where(self.transactions.c.user_id == user_id)
+        return self._paginate(
+            query,
+            self.transactions.c.created_at,
+            self.transactions.c.transaction_id,
+            cursor,
+            limit,
         )
-        result = self.session.execute(query)
-        return [row._asdict() for row in result.fetchall()]
 
     def reject_transaction(self, transaction_id: int, admin_id: int) -> bool:
         logger.debug("reject_transaction")
         query = (
             update(self.transactions)
             .where(self.transactions.c.transaction_id == transaction_id)
-            .values(status="rejected", admin_id=admin_id, processed_at=func.now())
+            .where(self.transactions.c.status == "pending")
+            .values(
+                status="rejected",
+                admin_id=admin_id,
+                processed_at=func.now(),
+                claimed_by=None,
+                claimed_at=None,
+            )
         )
         result = self.session.execute(query)
-        self.session.commit()
+        if result.rowcount:
+            self._enqueue_transaction_events([transaction_id], "transaction_rejected")
+        self._commit()
         return result.rowcount > 0
 
+    # Cola de administración: cada admin reserva un lote y lo resuelve entero
+    def claim_pending_transactions(
+        self,
+        admin_id: int,
+        limit: Optional[int] = None,
+        lease_seconds: Optional[int] = None,
+    ) -> List[Dict]:
+        logger.debug("claim_pending_transactions")
+        limit = limit or config.ADMIN_QUEUE_BATCH_SIZE
+        lease_seconds = lease_seconds or config.ADMIN_QUEUE_LEASE_SECONDS
+        t = self.transactions
+        expired = t.c.claimed_at < func.now() - timedelta(seconds=lease_seconds)
+        # SKIP LOCKED: lo que otro admin está reservando ahora mismo se salta
+        candidates = (
+            select(t.c.transaction_id)
+            .where(t.c.status == "pending")
+            .where(or_(t.c.claimed_by.is_(None), t.c.claimed_by == admin_id, expired))
+            .order_by(t.c.created_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        query = (
+            update(t)
+            .where(t.c.transaction_id.in_(candidates))
+            .values(claimed_by=admin_id, claimed_at=func.now())
+            .returning(*t.columns)
+        )
+        with self.transaction():
+            rows = [row._asdict() for row in self.session.execute(query)]
+        metrics.incr("admin_queue.claimed", len(rows))
+        return sorted(rows, key=lambda row: row["created_at"])
+
+    def _lock_claimed(self, transaction_ids: List[int], admin_id: int) -> List:
+        # Solo las que siguen pendientes y reservadas por este admin
+        query = (
+            self.transactions.select()
+            .where(self.transactions.c.transaction_id.in_(transaction_ids))
+            .where(self.transactions.c.status == "pending")
+            .where(self.transactions.c.claimed_by == admin_id)
+            .order_by(self.transactions.c.transaction_id)
+            .with_for_update()
+        )
+        return self.session.execute(query).fetchall()
+
+    def _resolve_claimed(self, transaction_ids: List[int], admin_id: int, status: str):
+        if not transaction_ids:
+            return
+        query = (
+            update(self.transactions)
+            .where(self.transactions.c.transaction_id.in_(transaction_ids))
+            .values(
+                status=status,
+                admin_id=admin_id,
+                processed_at=func.now(),
+                claimed_by=None,
+                claimed_at=None,
+            )
+        )
+        self.session.execute(query)
+        self._enqueue_transaction_events(transaction_ids, f"transaction_{status}")
+
+    def approve_transactions(self, transaction_ids: List[int], admin_id: int) -> Dict:
+        logger.debug("approve_transactions")
+        approved, skipped = [], []
+        with self.transaction():
+            rows = self._lock_claimed(transaction_ids, admin_id)
+            deposits = []
+            for row in rows:
+                if row.type == TransactionType.DEPOSIT:
+                    deposits.append(row.transaction_id)
+                elif not self._debit_withdrawal(row.user_id, row.amount):
+                    # Sin saldo: queda pendiente y reservada para revisarla a mano
+                    skipped.append(row.transaction_id)
+                    continue
+                approved.append(row.transaction_id)
+
+            # Depósitos agrupados por usuario en una sola sentencia
+            if deposits:
+                t = self.transactions
+                credits = (
+                    select(t.c.user_id, func.sum(t.c.amount).label("total"))
+                    .where(t.c.transaction_id.in_(deposits))
+                    .group_by(t.c.user_id)
+                    .subquery()
+                )
+                credit_query = (
+                    update(self.users)
+                    .where(self.users.c.user_id == credits.c.user_id)
+                    .values(balance=self.users.c.balance + credits.c.total)
+                )
+                self.session.execute(credit_query)
+            self._resolve_claimed(approved, admin_id, "approved")
+
+        stale = set(transaction_ids) - {row.transaction_id for row in rows}
+        metrics.incr("admin_queue.approved", len(approved))
+        logger.info(
+            f"Admin {admin_id}: {len(approved)} aprobadas, {len(skipped)} sin saldo, {len(stale)} ya no eran suyas"
+        )
+        return {"approved": approved, "skipped": skipped, "stale": sorted(stale)}
+
+    def reject_transactions(self, transaction_ids: List[int], admin_id: int) -> Dict:
+        logger.debug("reject_transactions")
+        with self.transaction():
+            rejected = [
+                row.transaction_id
+                for row in self._lock_claimed(transaction_ids, admin_id)
+            ]
+            self._resolve_claimed(rejected, admin_id, "rejected")
+
+        stale = set(transaction_ids) - set(rejected)
+        metrics.incr("admin_queue.rejected", len(rejected))
+        return {"rejected": rejected, "stale": sorted(stale)}
+
+    def release_transactions(
+        self, admin_id: int, transaction_ids: Optional[List[int]] = None
+    ) -> int:
+        logger.debug("release_transactions")
+        query = (
+            update(self.transactions)
+            .where(self.transactions.c.status == "pending")
+            .where(self.transactions.c.claimed_by == admin_id)
+            .values(claimed_by=None, claimed_at=None)
+        )
+        if transaction_ids is not None:
+            query = query.where(self.transactions.c.transaction_id.in_(transaction_ids))
+        result = self.session.execute(query)
+        self._commit()
+        return result.rowcount
+
     # CRUD para Transfers
     def create_transfer(self, transfer_data: Dict) -> int:
         logger.debug("create_transfer")
         query = insert(self.transfers).values(transfer_data)
         result = self.session.execute(query)
-        self.session.commit()
+        self._commit()
         return result.inserted_primary_key[0]
 
     def get_transfer(self, transfer_id: int) -> Optional[Dict]:
@@ -609,8 +2509,8 @@ class DatabaseManager:
         return result.fetchone()._asdict() if result.rowcount else None
 
     def get_user_transfers(
-        self, user_id: int, direction: str = "all", limit: int = 50
-    ) -> List[Dict]:
+        self, user_id: int, direction: str = "all", cursor: str = None, limit: int = 50
+    ) -> Page:
         logger.debug("get_user_transfer")
         query = self.transfers.select()
 
@@ -626,155 +2526,938 @@ class DatabaseManager:
                 )
             )
 
-        query = query.order_by(self.transfers.c.created_at.desc()).limit(limit)
-        result = self.session.execute(query)
-        return [row._asdict() for row in result.fetchall()]
+        return self._paginate(
+            query,
+            self.transfers.c.created_at,
+            self.transfers.c.transfer_id,
+            cursor,
+            limit,
+        )
 
     # CRUD para Bets
     def create_bet(self, bet_data: Dict) -> int:
         logger.debug("create_bet")
         try:
-            # 1. Crear la apuesta
-            query = insert(self.bets).values(bet_data)
-            result = self.session.execute(query)
-            bet_id = result.inserted_primary_key[0]
-
-            # 2. Descontar el saldo del usuario
-            user_id = bet_data["user_id"]
-            amount = bet_data["amount"]
-            user = self.get_user(user_id)
-            if user["balance"] < amount:
-                logger.warning(
-                    f"El usuario {user['name']} no tiene suficiente saldo para realizar la operación. Balance: {user['balance']} Solicitud: {amount}"
-                )
-                return False
+            with self.transaction():
+                # 1. Verificar el saldo del usuario
+                user_id = bet_data["user_id"]
+                amount = bet_data["amount"]
+                user = self.get_user(user_id)
+                if not user or user["balance"] < amount:
+                    logger.warning(
+                        f"El usuario {user_id} no tiene suficiente saldo para realizar la operación. Solicitud: {amount}"
+                    )
+                    return False
 
-            self.update_user_balance(user_id, -amount)
+                # 2. Crear la apuesta
+                query = insert(self.bets).values(bet_data)
+                result = self.session.execute(query)
+                bet_id = result.inserted_primary_key[0]
 
-            # 3. Registrar la transacción
-            transaction_data = {
-                "user_id": user_id,
-                "amount": amount,
-                "type": "bet",
-                "status": "completed",
-                "description": f"Apuesta #{bet_id}",
-            }
-            self.create_transaction(transaction_data)
+                # 3. Sumar el riesgo de la opción
+                self._add_exposure(
+                    bet_data["option_id"], amount, bet_data["potential_win"]
+                )
 
-            self.session.commit()
+                # 4. Descontar el saldo del usuario
+                self.update_user_balance(user_id, -amount)
+
+                # 5. Registrar la transacción
+                transaction_data = {
+                    "user_id": user_id,
+                    "amount": amount,
+                    "type": TransactionType.BET,
+                    "status": "completed",
+                    "description": f"Apuesta #{bet_id}",
+                }
+                self.create_transaction(transaction_data)
             return bet_id
+        except ExposureLimitExceeded as e:
+            logger.warning(str(e))
+            return False
         except Exception as e:
-            self.session.rollback()
             logger.error(f"Error creating bet: {e}")
             return False
 
-    def settle_bet(self, bet_id: int, won: bool) -> bool:
-        logger.debug("settle_bet")
+    def place_bet(
+        self,
+        user_id: int,
+        option_id: int,
+        amount: float,
+        idempotency_key: str = None,
+    ) -> int:
+        logger.debug("place_bet")
+        amount_type = self.bets.c.amount.type
+        option = (
+            select(
+                self.match_bet_options.c.option_id,
+                self.match_bet_options.c.match_id,
+                self.match_bet_options.c.odds,
+                self._option_cap().label("cap"),
+            )
+            .where(self.match_bet_options.c.option_id == option_id)
+            .where(self.match_bet_options.c.is_active)
+            .cte("option")
+        )
+        potential_win = func.round(literal(amount, amount_type) * option.c.odds, 2)
+
+        # 1. Descontar el saldo solo si alcanza, la opción está activa y su
+        # riesgo no pasa del tope
+        available = select(option.c.option_id)
+        if config.EXPOSURE_CAP_ACTION == "reject":
+            available = available.where(
+                self._exposure_fits(option.c.option_id, potential_win, option.c.cap)
+            )
+        debit = (
+            update(self.users)
+            .where(self.users.c.user_id == user_id)
+            .where(self.users.c.balance >= amount)
+            .where(available.exists())
+            .values(balance=self.users.c.balance - amount)
+            .returning(self.users.c.user_id, self.users.c.balance)
+            .cte("debit")
+        )
+
+        # 2. Crear la apuesta a partir del débito realizado
+        new_bet = (
+            insert(self.bets)
+            .from_select(
+                ["user_id", "option_id", "amount", "potential_win"],
+                select(
+                    debit.c.user_id,
+                    option.c.option_id,
+                    literal(amount, amount_type),
+                    potential_win,
+                ).select_from(debit.join(option, true())),
+            )
+            .returning(
+                self.bets.c.bet_id,
+                self.bets.c.user_id,
+                self.bets.c.option_id,
+                self.bets.c.amount,
+                self.bets.c.potential_win,
+            )
+            .cte("new_bet")
+        )
+
+        # 3. Registrar la transacción
+        type_type = self.transactions.c.type.type
+        ledger = (
+            insert(self.transactions)
+            .from_select(
+                ["user_id", "amount", "type", "status", "description"],
+                select(
+                    new_bet.c.user_id,
+                    literal(amount, amount_type),
+                    cast(literal(TransactionType.BET, type_type), type_type),
+                    literal("completed"),
+                    func.concat("Apuesta #", new_bet.c.bet_id),
+                ),
+            )
+            .returning(self.transactions.c.transaction_id)
+            .cte("ledger")
+        )
+        placed = new_bet.join(ledger, true())
+
+        # 4. Reservar la clave de idempotencia; un reintento choca con la PK
+        if idempotency_key:
+            claim = (
+                insert(self.bet_idempotency_keys)
+                .from_select(
+                    ["idempotency_key", "bet_id"],
+                    select(literal(idempotency_key), new_bet.c.bet_id),
+                )
+                .returning(self.bet_idempotency_keys.c.bet_id)
+                .cte("claim")
+            )
+            placed = placed.join(claim, true())
+
+        # 5. Sumar el riesgo de la opción. Las estadísticas se cuentan al
+        # liquidar, con lo apostado y lo ganado en la misma ventana
+        exposure, suspend = self._exposure_ctes(
+            select(
+                new_bet.c.option_id,
+                option.c.match_id,
+                new_bet.c.amount,
+                new_bet.c.potential_win,
+                literal(1),
+                option.c.cap,
+            ).select_from(new_bet.join(option, true()))
+        )
+
+        query = select(
+            new_bet.c.bet_id, exposure.c.option_id.label("exposed")
+        ).select_from(placed.outerjoin(exposure, true()))
+        if suspend is not None:
+            query = query.add_columns(
+                select(suspend.c.match_id).scalar_subquery().label("suspended")
+            )
         try:
-            # 1. Obtener información de la apuesta
-            bet_query = self.bets.select().where(self.bets.c.bet_id == bet_id)
-            bet_result = self.session.execute(bet_query)
-            bet = bet_result.fetchone()
+            with self.transaction():
+                row = self.session.execute(query).one_or_none()
+                bet_id = row.bet_id if row else None
+                if bet_id is not None and row.exposed is None:
+                    raise ExposureLimitExceeded(
+                        f"La opción {option_id} superaría su tope de riesgo"
+                    )
+                if suspend is not None and bet_id is not None and row.suspended:
+                    logger.warning(f"Opción {option_id} suspendida por tope de riesgo")
+                    self._invalidate("bet_options", row.suspended)
+        except ExposureLimitExceeded as e:
+            logger.warning(str(e))
+            return False
+        except IntegrityError as e:
+            # Dentro de una unidad de trabajo mayor la transacción ya quedó abortada
+            if idempotency_key and not self.in_transaction:
+                logger.info(f"Apuesta repetida con clave {idempotency_key}")
+                return self.get_bet_id_by_idempotency_key(idempotency_key)
+            logger.error(f"Error placing bet: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Error placing bet: {e}")
+            return False
 
-            if not bet or bet["status"] != "pending":
-                return False
+        if bet_id is None and idempotency_key:
+            # Un reintento tras una apuesta ya confirmada puede fallar el débito
+            bet_id = self.get_bet_id_by_idempotency_key(idempotency_key)
 
-            # 2. Actualizar estado de la apuesta
-            update_bet_query = (
-                update(self.bets)
-                .where(self.bets.c.bet_id == bet_id)
-                .values(status="won" if won else "lost", settled_at=func.now())
+        if bet_id is None:
+            logger.warning(
+                f"El usuario {user_id} no tiene suficiente saldo o la opción {option_id} no está disponible o llegó a su tope. Solicitud: {amount}"
             )
-            self.session.execute(update_bet_query)
+            return False
 
-            # 3. Si ganó, acreditar el premio
-            if won:
-                self.update_user_balance(bet["user_id"], bet["potential_win"])
+        return bet_id
+
+    def place_parlay(
+        self,
+        user_id: int,
+        option_ids: List[int],
+        amount: float,
+        idempotency_key: str = None,
+    ) -> int:
+        logger.debug("place_parlay")
+        if idempotency_key:
+            parlay_id = self.get_parlay_id_by_idempotency_key(idempotency_key)
+            if parlay_id is not None:
+                logger.info(f"Combinada repetida con clave {idempotency_key}")
+                return parlay_id
+        option_ids = list(dict.fromkeys(option_ids))
+        if not 2 <= len(option_ids) <= config.PARLAY_MAX_LEGS:
+            logger.warning(f"Combinada con {len(option_ids)} selecciones rechazada")
+            return False
 
-                # Registrar transacción
-                transaction_data = {
-                    "user_id": bet["user_id"],
-                    "amount": bet["potential_win"],
-                    "type": "win",
-                    "status": "completed",
-                    "description": f"Ganancia apuesta #{bet_id}",
-                }
-                self.create_transaction(transaction_data)
+        options = self.match_bet_options
+        try:
+            with self.transaction():
+                # 1. Cuotas vigentes, una selección por partido
+                query = (
+                    select(options.c.option_id, options.c.match_id, options.c.odds)
+                    .where(options.c.option_id.in_(option_ids))
+                    .where(options.c.is_active)
+                )
+                rows = self.session.execute(query).fetchall()
+                match_ids = {row.match_id for row in rows}
+                if len(rows) != len(option_ids) or len(match_ids) != len(rows):
+                    logger.warning(
+                        f"Combinada inválida del usuario {user_id}: {option_ids}"
+                    )
+                    return False
+                combined_odds = Decimal(1)
+                for row in rows:
+                    combined_odds *= row.odds
+                combined_odds = combined_odds.quantize(Decimal("0.01"))
+                potential_win = (Decimal(str(amount)) * combined_odds).quantize(
+                    Decimal("0.01")
+                )
 
-            self.session.commit()
+                # 2. Descontar el saldo solo si alcanza
+                debit = (
+                    update(self.users)
+                    .where(self.users.c.user_id == user_id)
+                    .where(self.users.c.balance >= amount)
+                    .values(balance=self.users.c.balance - amount)
+                    .returning(self.users.c.user_id)
+                )
+                if self.session.execute(debit).scalar() is None:
+                    logger.warning(
+                        f"El usuario {user_id} no tiene suficiente saldo para realizar la operación. Solicitud: {amount}"
+                    )
+                    return False
+
+                # 3. Crear la combinada con sus selecciones
+                query = insert(self.parlays).values(
+                    user_id=user_id,
+                    amount=amount,
+                    combined_odds=combined_odds,
+                    potential_win=potential_win,
+                    legs_count=len(rows),
+                    pending_legs=len(rows),
+                    idempotency_key=idempotency_key,
+                )
+                parlay_id = self.session.execute(query).inserted_primary_key[0]
+                self.session.execute(
+                    insert(self.parlay_legs),
+                    [
+                        {
+                            "parlay_id": parlay_id,
+                            "option_id": row.option_id,
+                            "odds": row.odds,
+                        }
+                        for row in rows
+                    ],
+                )
+
+                # 4. Registrar la transacción
+                self.create_transaction(
+                    {
+                        "user_id": user_id,
+                        "amount": amount,
+                        "type": TransactionType.BET,
+                        "status": "completed",
+                        "description": f"Combinada #{parlay_id}",
+                    }
+                )
+            return parlay_id
+        except IntegrityError as e:
+            # Dos entregas a la vez: la segunda choca con el índice único y
+            # deshace su débito
+            if idempotency_key and not self.in_transaction:
+                logger.info(f"Combinada repetida con clave {idempotency_key}")
+                return self.get_parlay_id_by_idempotency_key(idempotency_key)
+            logger.error(f"Error placing parlay: {e}")
+            return False
+        except Exception as e:
+            logger.error(f"Error placing parlay: {e}")
+            return False
+
+    def get_parlay_id_by_idempotency_key(self, idempotency_key: str) -> Optional[int]:
+        logger.debug("get_parlay_id_by_idempotency_key")
+        query = select(self.parlays.c.parlay_id).where(
+            self.parlays.c.idempotency_key == idempotency_key
+        )
+        return self.session.execute(query).scalar()
+
+    def get_bet_id_by_idempotency_key(self, idempotency_key: str) -> Optional[int]:
+        logger.debug("get_bet_id_by_idempotency_key")
+        query = select(self.bet_idempotency_keys.c.bet_id).where(
+            self.bet_idempotency_keys.c.idempotency_key == idempotency_key
+        )
+        return self.session.execute(query).scalar()
+
+    def settle_bet(self, bet_id: int, won: bool) -> bool:
+        logger.debug("settle_bet")
+        try:
+            with self.transaction():
+                # 1. Obtener información de la apuesta
+                bet_query = self.bets.select().where(self.bets.c.bet_id == bet_id)
+                bet_result = self.session.execute(bet_query)
+                bet = bet_result.fetchone()
+
+                if not bet or bet.status != BetStatus.PENDING:
+                    return False
+
+                # 2. Actualizar estado de la apuesta
+                update_bet_query = (
+                    update(self.bets)
+                    .where(self.bets.c.bet_id == bet_id)
+                    .values(
+                        status=BetStatus.WIN if won else BetStatus.LOSE,
+                        settled_at=func.now(),
+                    )
+                )
+                self.session.execute(update_bet_query)
+                self._release_exposure(bet.option_id, bet.potential_win, won)
+                self._enqueue_settled_events(self.bets, [bet_id], "bet_settled")
+
+                self.session.execute(
+                    self._user_stats_upsert(
+                        self._stats_source(
+                            bet.user_id,
+                            staked=bet.amount,
+                            won=bet.potential_win if won else 0,
+                            bets_count=1,
+                            win_count=1 if won else 0,
+                            streak=1 if won else -1,
+                        )
+                    )
+                )
+
+                # 3. Si ganó, acreditar el premio
+                if won:
+                    self.update_user_balance(bet.user_id, bet.potential_win)
+
+                    # Registrar transacción
+                    transaction_data = {
+                        "user_id": bet.user_id,
+                        "amount": bet.potential_win,
+                        "type": TransactionType.WIN,
+                        "status": "completed",
+                        "description": f"Ganancia apuesta #{bet_id}",
+                    }
+                    self.create_transaction(transaction_data)
             return True
         except Exception as e:
-            self.session.rollback()
             logger.error(f"Error settling bet: {e}")
             return False
 
     # Métodos adicionales para operaciones complejas
-    def get_user_bets(self, user_id: int, status: str = None) -> List[Dict]:
+    def get_user_bets(
+        self, user_id: int, status=None, cursor: str = None, limit: int = 10
+    ) -> Page:
         logger.debug("get_user_bets")
-        query = self.bets.select().where(self.bets.c.user_id == user_id)
-        if status:
-            query = query.where(self.bets.c.status == status)
-        result = self.session.execute(query)
-        return [row._asdict() for row in result.fetchall()]
+        params = {"user_id": user_id}
+        if isinstance(status, (list, tuple, set)):
+            params["statuses"] = list(status)
+        elif status:
+            params["statuses"] = [status]
+        return self._paginate(
+            self._user_bets_query,
+            self.bets.c.created_at,
+            self.bets.c.bet_id,
+            cursor,
+            limit,
+            params,
+            self._user_bets_pages["statuses" in params],
+        )
+
+    def get_user_parlays(
+        self, user_id: int, cursor: str = None, limit: int = 10
+    ) -> Page:
+        logger.debug("get_user_parlays")
+        query = self.parlays.select().where(self.parlays.c.user_id == user_id)
+        return self._paginate(
+            query, self.parlays.c.created_at, self.parlays.c.parlay_id, cursor, limit
+        )
 
-    def get_pending_transactions(self) -> List[Dict]:
+    def get_parlay_legs(self, parlay_id: int) -> List[Dict]:
+        logger.debug("get_parlay_legs")
+        query = (
+            select(
+                self.parlay_legs,
+                self.match_bet_options.c.prediction,
+                self.matches.c.team_home,
+                self.matches.c.team_away,
+            )
+            .join(
+                self.match_bet_options,
+                self.match_bet_options.c.option_id == self.parlay_legs.c.option_id,
+            )
+            .join(
+                self.matches,
+                self.matches.c.match_id == self.match_bet_options.c.match_id,
+            )
+            .where(self.parlay_legs.c.parlay_id == parlay_id)
+            .order_by(self.parlay_legs.c.leg_id)
+        )
+        return self._rows(query)
+
+    def get_pending_transactions(
+        self, mode: RowMode = RowMode.DICT, *, limit: Optional[int] = None
+    ) -> Iterable:
         logger.debug("get_pending_transactions")
         query = (
             self.transactions.select()
             .where(self.transactions.c.status == "pending")
             .order_by(self.transactions.c.created_at)
+            .limit(limit or config.ADMIN_QUEUE_BATCH_SIZE)
         )
-        result = self.session.execute(query)
-        return [row._asdict() for row in result.fetchall()]
+        return self._rows(query, mode)
 
     def transfer_balance(self, sender_id: int, receiver_id: int, amount: float) -> bool:
         logger.debug("transfer_balance")
         try:
-            # 1. Verificar saldo del emisor
-            sender = self.get_user(sender_id)
-            if not sender or sender["balance"] < amount:
-                logger.warning(
-                    f"El usuario {sender['name']} no tiene suficiente saldo para realizar la operación. Balance: {sender['balance']} Cantidad solicitada: {amount}"
-                )
-                return False
-
-            # 2. Actualizar saldos
-            self.update_user_balance(sender_id, -amount)
-            self.update_user_balance(receiver_id, amount)
-
-            # 3. Registrar transferencia
-            transfer_data = {
-                "sender_id": sender_id,
-                "receiver_id": receiver_id,
-                "amount": amount,
-            }
-            self.create_transfer(transfer_data)
-
-            # 4. Registrar transacciones
-            sender_transaction = {
-                "user_id": sender_id,
-                "amount": amount,
-                "type": "transfer_out",
-                "status": "completed",
-                "description": f"Transferencia a usuario #{receiver_id}",
-            }
-            self.create_transaction(sender_transaction)
-
-            receiver_transaction = {
-                "user_id": receiver_id,
-                "amount": amount,
-                "type": "transfer_in",
-                "status": "completed",
-                "description": f"Transferencia de usuario #{sender_id}",
-            }
-            self.create_transaction(receiver_transaction)
+            with self.transaction():
+                # 1. Verificar saldo del emisor
+                sender = self.get_user(sender_id)
+                if not sender or sender["balance"] < amount:
+                    logger.warning(
+                        f"El usuario {sender_id} no tiene suficiente saldo para realizar la operación. Cantidad solicitada: {amount}"
+                    )
+                    return False
 
-            self.session.commit()
+                # 2. Actualizar saldos
+                self.update_user_balance(sender_id, -amount)
+                self.update_user_balance(receiver_id, amount)
+
+                # 3. Registrar transferencia
+                transfer_data = {
+                    "sender_id": sender_id,
+                    "receiver_id": receiver_id,
+                    "amount": amount,
+                }
+                self.create_transfer(transfer_data)
+
+                # 4. Registrar transacciones
+                sender_transaction = {
+                    "user_id": sender_id,
+                    "amount": amount,
+                    "type": TransactionType.TRANSFER_OUT,
+                    "status": "completed",
+                    "description": f"Transferencia a usuario #{receiver_id}",
+                }
+                self.create_transaction(sender_transaction)
+
+                receiver_transaction = {
+                    "user_id": receiver_id,
+                    "amount": amount,
+                    "type": TransactionType.TRANSFER_IN,
+                    "status": "completed",
+                    "description": f"Transferencia de usuario #{sender_id}",
+                }
+                self.create_transaction(receiver_transaction)
+
+                # 5. Avisar al receptor
+                self._enqueue_event(
+                    receiver_id,
+                    "transfer_received",
+                    {"sender_id": sender_id, "amount": float(amount)},
+                )
             return True
         except Exception as e:
-            self.session.rollback()
             logger.error(f"Error transferring balance: {e}")
             return False
 
+    # Deduplicación de updates reentregados por Telegram
+    def mark_update_processed(self, update_id: int) -> bool:
+        query = (
+            pg_insert(self.processed_updates)
+            .values(update_id=update_id)
+            .on_conflict_do_nothing(index_elements=["update_id"])
+        )
+        result = self.session.execute(query)
+        self._commit()
+        return result.rowcount > 0
+
+    def purge_processed_updates(self, retention_hours: Optional[int] = None) -> int:
+        logger.debug("purge_processed_updates")
+        hours = retention_hours or config.UPDATE_DEDUPE_RETENTION_HOURS
+        query = delete(self.processed_updates).where(
+            self.processed_updates.c.received_at < func.now() - timedelta(hours=hours)
+        )
+        result = self.session.execute(query)
+        self._commit()
+        logger.info(f"{result.rowcount} update_id procesados purgados")
+        return result.rowcount
+
+    # Reparto del outbox: varios despachadores pueden drenarlo en paralelo
+    def claim_outbox_events(
+        self, limit: Optional[int] = None, lease_seconds: Optional[int] = None
+    ) -> List[Dict]:
+        logger.debug("claim_outbox_events")
+        o = self.outbox
+        lease = timedelta(seconds=lease_seconds or config.OUTBOX_LEASE_SECONDS)
+        candidates = (
+            select(o.c.event_id)
+            .where(o.c.status == "pending")
+            .where(o.c.available_at <= func.now())
+            .order_by(o.c.available_at)
+            .limit(limit or config.OUTBOX_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        # Si el despachador muere con el lote en la mano, vuelve a salir al
+        # vencer la reserva: entrega al menos una vez
+        query = (
+            update(o)
+            .where(o.c.event_id.in_(candidates))
+            .values(available_at=func.now() + lease, attempts=o.c.attempts + 1)
+            .returning(*o.columns)
+        )
+        with self.transaction():
+            rows = [row._asdict() for row in self.session.execute(query)]
+        return sorted(rows, key=lambda row: row["event_id"])
+
+    def ack_outbox_events(self, event_ids: List[int]) -> int:
+        logger.debug("ack_outbox_events")
+        if not event_ids:
+            return 0
+        query = delete(self.outbox).where(self.outbox.c.event_id.in_(event_ids))
+        result = self.session.execute(query)
+        self._commit()
+        return result.rowcount
+
+    def retry_outbox_event(
+        self, event_id: int, error: str, delay: Optional[float] = None
+    ) -> bool:
+        logger.debug("retry_outbox_event")
+        o = self.outbox
+        values = {"last_error": error}
+        if delay is None:
+            values["status"] = "failed"
+        else:
+            values["available_at"] = func.now() + timedelta(seconds=delay)
+        query = update(o).where(o.c.event_id == event_id).values(values)
+        result = self.session.execute(query)
+        self._commit()
+        return result.rowcount > 0
+
+    # Difusiones masivas (broadcast.py)
+    def create_broadcast(self, text: str, created_by: Optional[int] = None) -> int:
+        logger.debug("create_broadcast")
+        query = insert(self.broadcasts).values(text=text, created_by=created_by)
+        result = self.session.execute(query)
+        self._commit()
+        return result.inserted_primary_key[0]
+
+    def get_broadcast(self, broadcast_id: int) -> Optional[Dict]:
+        logger.debug("get_broadcast")
+        query = self.broadcasts.select().where(
+            self.broadcasts.c.broadcast_id == broadcast_id
+        )
+        result = self.session.execute(query)
+        return result.fetchone()._asdict() if result.rowcount else None
+
+    @contextmanager
+    def broadcast_lock(self, broadcast_id: int):
+        # Lock de sesión en una conexión propia: dura todo el envío aunque la
+        # sesión normal confirme lote a lote. False si otro proceso ya lo tiene
+        key = (func.hashtext("broadcasts"), broadcast_id)
+        with self.engine.connect() as connection:
+            query = select(func.pg_try_advisory_lock(*key))
+            acquired = connection.execute(query).scalar()
+            connection.commit()
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    connection.execute(select(func.pg_advisory_unlock(*key)))
+                    connection.commit()
+
+    def get_broadcast_recipients(self, after_user_id: int, limit: int) -> List[int]:
+        logger.debug("get_broadcast_recipients")
+        # Keyset por user_id: cada lote es un rango del índice de la PK
+        u = self.users
+        query = (
+            select(u.c.user_id)
+            .where(u.c.user_id > after_user_id)
+            .where(u.c.is_active)
+            .where(u.c.bot_blocked_at.is_(None))
+            .order_by(u.c.user_id)
+            .limit(limit)
+        )
+        return list(self.read_session.execute(query).scalars())
+
+    def mark_users_blocked(self, user_ids: List[int]) -> int:
+        logger.debug("mark_users_blocked")
+        if not user_ids:
+            return 0
+        query = (
+            update(self.users)
+            .where(self.users.c.user_id.in_(user_ids))
+            .where(self.users.c.bot_blocked_at.is_(None))
+            .values(bot_blocked_at=func.now())
+        )
+        result = self.session.execute(query)
+        self._commit()
+        return result.rowcount
+
+    def checkpoint_broadcast(
+        self,
+        broadcast_id: int,
+        last_user_id: int,
+        sent: int,
+        failures: List[Dict],
+        blocked: List[int],
+    ) -> None:
+        logger.debug("checkpoint_broadcast")
+        # Fallos, bloqueos y avance del lote en una sola transacción
+        with self.transaction():
+            if failures:
+                query = (
+                    pg_insert(self.broadcast_failures)
+                    .values([{"broadcast_id": broadcast_id, **row} for row in failures])
+                    .on_conflict_do_nothing()
+                )
+                self.session.execute(query)
+            self.mark_users_blocked(blocked)
+            b = self.broadcasts
+            query = (
+                update(b)
+                .where(b.c.broadcast_id == broadcast_id)
+                .values(
+                    status="running",
+                    last_user_id=last_user_id,
+                    sent=b.c.sent + sent,
+                    failed=b.c.failed + len(failures),
+                )
+            )
+            self.session.execute(query)
+
+    def finish_broadcast(self, broadcast_id: int) -> bool:
+        logger.debug("finish_broadcast")
+        query = (
+            update(self.broadcasts)
+            .where(self.broadcasts.c.broadcast_id == broadcast_id)
+            .values(status="done", finished_at=func.now())
+        )
+        result = self.session.execute(query)
+        self._commit()
+        return result.rowcount > 0
+
+    # Conciliación entre users.balance y el libro de transacciones
+    def reconcile_balances(
+        self, chunk_size: int = 1000, snapshot: bool = True, lag_seconds: int = 300
+    ) -> Dict:
+        logger.debug("reconcile_balances")
+        started = time.perf_counter()
+        t = self.transactions
+        s = self.balance_snapshots
+        credit_types = [
+            TransactionType.DEPOSIT,
+            TransactionType.WIN,
+            TransactionType.TRANSFER_IN,
+        ]
+        signed = case((t.c.type.in_(credit_types), t.c.amount), else_=-t.c.amount)
+        effective_at = func.coalesce(t.c.processed_at, t.c.created_at)
+
+        # Vista consistente de saldos y libro durante todo el recorrido
+        self.session.connection(
+            execution_options={"isolation_level": "REPEATABLE READ"}
+        )
+        now, since = self.session.execute(
+            select(func.localtimestamp(), func.min(s.c.as_of))
+        ).one()
+
+        # Lo más reciente puede pertenecer a transacciones aún sin confirmar;
+        # solo entra en la próxima instantánea pasado este margen
+        upto = now - timedelta(seconds=lag_seconds)
+
+        deltas = select(
+            t.c.user_id,
+            func.sum(signed).label("delta"),
+            func.sum(signed).filter(effective_at <= upto).label("settled_delta"),
+        ).where(t.c.status.in_(["approved", "completed"]))
+        if since is not None:
+            deltas = deltas.where(effective_at > since)
+        deltas = deltas.group_by(t.c.user_id).subquery()
+
+        base = func.coalesce(s.c.balance, 0)
+        query = (
+            select(
+                self.users.c.user_id,
+                self.users.c.balance,
+                (base + func.coalesce(deltas.c.delta, 0)).label("expected"),
+                (base + func.coalesce(deltas.c.settled_delta, 0)).label("snapshot"),
+            )
+            .outerjoin(s, s.c.user_id == self.users.c.user_id)
+            .outerjoin(deltas, deltas.c.user_id == self.users.c.user_id)
+            .order_by(self.users.c.user_id)
+        )
+
+        users = mismatches = 0
+        try:
+            # Cursor del lado del servidor: memoria constante sin importar el tamaño
+            result = self.session.execute(
+                query, execution_options={"yield_per": chunk_size}
+            )
+            for chunk in result.partitions():
+                users += len(chunk)
+                for row in chunk:
+                    if row.balance != row.expected:
+                        mismatches += 1
+                        logger.warning(
+                            f"Saldo descuadrado del usuario {row.user_id}: balance {row.balance}, según el libro {row.expected}"
+                        )
+                if snapshot:
+                    snapshots = [
+                        {"user_id": row.user_id, "balance": row.snapshot, "as_of": upto}
+                        for row in chunk
+                    ]
+                    query = pg_insert(s).values(snapshots)
+                    query = query.on_conflict_do_update(
+                        index_elements=[s.c.user_id],
+                        set_={
+                            "balance": query.excluded.balance,
+                            "as_of": query.excluded.as_of,
+                            "taken_at": func.now(),
+                        },
+                    )
+                    self.session.execute(query)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+
+        report = {
+            "users": users,
+            "mismatches": mismatches,
+            "since": since,
+            "elapsed": time.perf_counter() - started,
+        }
+        logger.info(
+            f"Conciliación: {users} usuarios, {mismatches} descuadres en {report['elapsed']:.3f}s"
+        )
+        return report
+
+    # Particiones mensuales y archivado de lo ya liquidado
+    def ensure_partitions(self, months_ahead: Optional[int] = None):
+        if not config.DB_PARTITIONED:
+            return
+        if months_ahead is None:
+            months_ahead = config.DB_PARTITION_MONTHS_AHEAD
+        current = date.today().replace(day=1)
+        with self.engine.begin() as connection:
+            for table in (self.bets, self.transactions):
+                self._check_partitioned(connection, table.name)
+                month = current
+                for _ in range(months_ahead + 1):
+                    following = (month + timedelta(days=32)).replace(day=1)
+                    self._create_partition(connection, table.name, month, following)
+                    month = following
+                # La default solo recoge lo que caiga fuera de los meses creados
+                connection.execute(
+                    text(
+                        f"CREATE TABLE IF NOT EXISTS {table.name}_default "
+                        f"PARTITION OF {table.name} DEFAULT"
+                    )
+                )
+        logger.info(f"Particiones aseguradas hasta {months_ahead} meses adelante")
+
+    @staticmethod
+    def _check_partitioned(connection, table_name: str):
+        # create_all no convierte una tabla ya creada: sin esto Postgres falla
+        # con un error crudo al colgarle la primera partición
+        query = text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass(:name))"
+        )
+        if not connection.execute(query, {"name": table_name}).scalar():
+            raise MigrationError(
+                f"{table_name} existe sin particionar y DB_PARTITIONED está "
+                f"activo. Hay que migrarla a mano: crear {table_name} particionada "
+                f"por created_at con otro nombre, copiar las filas, renombrar las "
+                f"dos tablas y volver a ejecutar init.py"
+            )
+
+    @staticmethod
+    def _create_partition(connection, table_name: str, start: date, end: date):
+        partition = f"{table_name}_{start:%Y_%m}"
+        default = f"{table_name}_default"
+        exists = text("SELECT to_regclass(:name) IS NOT NULL")
+        if connection.execute(exists, {"name": partition}).scalar():
+            return
+        bounds = f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        in_range = "created_at >= :start AND created_at < :end"
+        params = {"start": start, "end": end}
+        stray = connection.execute(exists, {"name": default}).scalar() and (
+            connection.execute(
+                text(f"SELECT 1 FROM {default} WHERE {in_range} LIMIT 1"), params
+            ).first()
+        )
+        if not stray:
+            connection.execute(
+                text(f"CREATE TABLE {partition} PARTITION OF {table_name} {bounds}")
+            )
+            return
+
+        # Filas del mes que cayeron en la default: con ellas dentro no se puede
+        # crear la partición, así que se mueven a una tabla suelta y se adjunta
+        connection.execute(text(f"LOCK TABLE {default} IN EXCLUSIVE MODE"))
+        connection.execute(
+            text(
+                f"CREATE TABLE {partition} "
+                f"(LIKE {table_name} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+            )
+        )
+        moved = connection.execute(
+            text(
+                f"WITH moved AS (DELETE FROM {default} WHERE {in_range} RETURNING *) "
+                f"INSERT INTO {partition} SELECT * FROM moved"
+            ),
+            params,
+        ).rowcount
+        connection.execute(
+            text(f"ALTER TABLE {table_name} ATTACH PARTITION {partition} {bounds}")
+        )
+        logger.warning(f"Movidas {moved} filas de {default} a {partition}")
+
+    def _archive_batch(self, table: Table, archive: Table, condition, limit: int):
+        id_column = table.primary_key.columns.values()[0]
+        # SKIP LOCKED: lo que esté tocando el tráfico vivo se archiva en otra pasada
+        candidates = (
+            select(id_column, table.c.created_at)
+            .where(condition)
+            .order_by(table.c.created_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        moved = (
+            delete(table)
+            .where(tuple_(id_column, table.c.created_at).in_(candidates))
+            .returning(*table.columns)
+            .cte("moved")
+        )
+        columns = [column.name for column in table.columns]
+        query = insert(archive).from_select(
+            columns, select(*[moved.c[name] for name in columns])
+        )
+        return self.session.execute(query).rowcount
+
+    def _archive_jobs(self, cutoff: datetime, snapshot_floor: Optional[datetime]):
+        # (tabla, archivo, condición) de lo que ya se puede archivar
+        t = self.transactions
+        effective_at = func.coalesce(t.c.processed_at, t.c.created_at)
+        jobs = [
+            (
+                self.bets,
+                self.bets_archive,
+                (self.bets.c.status != BetStatus.PENDING)
+                & (self.bets.c.created_at < cutoff),
+            )
+        ]
+        if snapshot_floor is not None:
+            jobs.append(
+                (
+                    t,
+                    self.transactions_archive,
+                    (t.c.status != "pending")
+                    & (t.c.created_at < cutoff)
+                    & (effective_at <= snapshot_floor),
+                )
+            )
+        return jobs
+
+    def archive_settled(
+        self,
+        retention_days: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        pause: float = 0.1,
+    ) -> Dict:
+        logger.debug("archive_settled")
+        started = time.perf_counter()
+        if retention_days is None:
+            retention_days = config.ARCHIVE_RETENTION_DAYS
+        if batch_size is None:
+            batch_size = config.ARCHIVE_BATCH_SIZE
+        cutoff = datetime.now() - timedelta(days=retention_days)
+
+        # La conciliación parte de las instantáneas: no se archiva nada del
+        # libro que todavía no esté cubierto por una
+        snapshot_floor = self.session.execute(
+            select(func.min(self.balance_snapshots.c.as_of))
+        ).scalar()
+        self.session.rollback()
+
+        jobs = self._archive_jobs(cutoff, snapshot_floor)
+        if snapshot_floor is None:
+            logger.warning("Sin instantáneas de saldo: no se archivan transacciones")
+
+        report = {"bets": 0, "transactions": 0}
+        for table, archive, condition in jobs:
+            while True:
+                # Lotes cortos, cada uno en su propia transacción
+                with self.transaction():
+                    moved = self._archive_batch(table, archive, condition, batch_size)
+                report[table.name] += moved
+                if moved < batch_size:
+                    break
+                time.sleep(pause)
+
+        report["elapsed"] = time.perf_counter() - started
+        logger.info(
+            f"Archivado: {report['bets']} apuestas y {report['transactions']} transacciones en {report['elapsed']:.3f}s"
+        )
+        return report
+
 
-db = DatabaseManager(config.DATABASE_URL)
+db = DatabaseManager(config.DATABASE_URL, config.DATABASE_REPLICA_URL)
@@ -0,0 +1,145 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+from typing import Optional
+
+from bot import bot
+from config import config
+from database import db
+from metrics import metrics
+from sender import sender
+
+logger = logging.getLogger("chatbot.dispatcher")
+
+_STOP = object()
+
+
+class UpdateDispatcher:
+    # Un hilo por shard y cada chat siempre al mismo shard: los updates de un
+    # chat se procesan en orden y los de chats distintos en paralelo
+    def __init__(self, bot, workers: int, queue_size: int, dedupe_window: int):
+        self.bot = bot
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.threads = []
+        self._lock = threading.Lock()
+        self._closing = False
+        # Últimos update_id aceptados por este worker
+        self._recent = OrderedDict()
+        self._dedupe_window = dedupe_window
+        metrics.gauge("updates.queue_depth", self.depth)
+
+    def depth(self) -> int:
+        return sum(shard.qsize() for shard in self.queues)
+
+    def _start(self):
+        # Perezoso: los hilos nacen en el worker ya forkeado, no en el master
+        with self._lock:
+            if self.threads:
+                return
+            for index, shard in enumerate(self.queues):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(shard,),
+                    name=f"updates-{index}",
+                    daemon=True,
+                )
+                thread.start()
+                self.threads.append(thread)
+            atexit.register(self.shutdown)
+
+    @staticmethod
+    def _chat_id(update) -> int:
+        if update.message:
+            return update.message.chat.id
+        if update.callback_query:
+            if update.callback_query.message:
+                return update.callback_query.message.chat.id
+            return update.callback_query.from_user.id
+        return update.update_id
+
+    def _drop_duplicate(self, update_id: int) -> None:
+        metrics.incr("updates.duplicates")
+        logger.info(f"Update {update_id} repetido, se descarta")
+
+    def _typing(self, update):
+        if update.message or update.callback_query:
+            return sender.typing(self._chat_id(update))
+        return nullcontext()
+
+    def submit(self, update) -> bool:
+        # False = cola llena o cerrando: el webhook responde 503 y Telegram reintenta
+        if self._closing:
+            return False
+        if not self.threads:
+            self._start()
+        with self._lock:
+            if update.update_id in self._recent:
+                self._drop_duplicate(update.update_id)
+                return True
+            shard = self.queues[self._chat_id(update) % len(self.queues)]
+            try:
+                shard.put_nowait((time.perf_counter(), update))
+            except queue.Full:
+                metrics.incr("updates.rejected")
+                logger.warning(f"Cola llena, se rechaza el update {update.update_id}")
+                return False
+            self._recent[update.update_id] = None
+            if len(self._recent) > self._dedupe_window:
+                self._recent.popitem(last=False)
+        metrics.incr("updates.enqueued")
+        return True
+
+    def _work(self, shard: queue.Queue):
+        while True:
+            item = shard.get()
+            if item is _STOP:
+                return
+            enqueued_at, update = item
+            metrics.observe("updates.wait", time.perf_counter() - enqueued_at)
+            try:
+                # La tabla cubre lo que la ventana en memoria no ve: otros workers
+                # y reinicios. Se reclama antes del handler con un INSERT atómico
+                # para que dos workers no lo procesen a la vez; un handler que
+                # falla no se reintenta (telebot ya se traga su excepción)
+                if not db.mark_update_processed(update.update_id):
+                    self._drop_duplicate(update.update_id)
+                    continue
+                with metrics.timer("updates.process"), self._typing(update):
+                    self.bot.process_new_updates([update])
+            except Exception as exc:
+                # Errores del propio despacho (base de datos, typing); los de
+                # los handlers los cuenta SessionMiddleware
+                metrics.incr("updates.failed")
+                logger.error(f"Error procesando el update {update.update_id}: {exc}")
+            finally:
+                db.remove_session()
+
+    def shutdown(self, timeout: Optional[float] = None):
+        # Deja de aceptar y vacía lo encolado antes de salir
+        if self._closing:
+            return
+        self._closing = True
+        deadline = time.monotonic() + (timeout or config.UPDATE_DRAIN_TIMEOUT)
+        pending = self.depth()
+        for shard in self.queues:
+            try:
+                shard.put(_STOP, timeout=max(deadline - time.monotonic(), 0))
+            except queue.Full:
+                pass
+        for thread in self.threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+        # Los marcadores de parada de los hilos que no llegaron no cuentan
+        left = self.depth() - sum(thread.is_alive() for thread in self.threads)
+        if left:
+            logger.warning(f"Apagado con {left} updates sin procesar")
+        else:
+            logger.info(f"Cola drenada: {pending} updates procesados al apagar")
+
+
+dispatcher = UpdateDispatcher(
+    bot, config.UPDATE_WORKERS, config.UPDATE_QUEUE_SIZE, config.UPDATE_DEDUPE_WINDOW
+)
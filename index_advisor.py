@@ -0,0 +1,181 @@
+# Ejecuta EXPLAIN sobre cada método de consulta de DatabaseManager y sobre las
+# escrituras calientes, y marca los planes que todavía hacen Seq Scan.
+# Uso: python index_advisor.py
+import inspect
+import logging
+import sys
+from datetime import datetime
+
+from sqlalchemy import event
+
+from database import DatabaseManager, db
+from logging_conf import configure_logging
+
+configure_logging()
+logger = logging.getLogger("chatbot.index_advisor")
+
+# Catálogos pequeños donde un Seq Scan es lo más barato
+ALLOWED_SEQ_SCANS = {"sports", "bet_types", "cache_invalidations"}
+
+
+# Escrituras calientes: se ejecutan dentro de una transacción que se deshace
+# y solo se analizan las sentencias que emiten
+WRITE_PATHS = {
+    "place_bet": lambda: db.place_bet(0, 0, 1),
+    "place_parlay": lambda: db.place_parlay(0, [0, 1], 1),
+    "settle_match": lambda: db.settle_match(0, [0]),
+    "archive_settled": lambda: [
+        db._archive_batch(table, archive, condition, 1)
+        for table, archive, condition in db._archive_jobs(
+            datetime.now(), datetime.now()
+        )
+    ],
+}
+
+
+class Discard(Exception):
+    pass
+
+
+def query_methods():
+    for name, method in inspect.getmembers(DatabaseManager, inspect.isfunction):
+        if name.startswith("get_"):
+            yield (
+                name,
+                lambda method=method, name=name: getattr(db, name)(
+                    *sample_args(method)
+                ),
+            )
+
+
+def write_paths():
+    for name, call in WRITE_PATHS.items():
+
+        def discarded(call=call):
+            try:
+                with db.transaction():
+                    call()
+                    raise Discard()
+            except Discard:
+                pass
+
+        yield name, discarded
+
+
+def sample_args(method):
+    args = []
+    for param in list(inspect.signature(method).parameters.values())[1:]:
+        if param.default is not inspect.Parameter.empty:
+            continue
+        args.append("" if param.annotation is str else 0)
+    return args
+
+
+def capture_statements(call):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        statements.append((statement, parameters))
+
+    # Las lecturas pueden ir a la réplica; el EXPLAIN se hace igual en el primario
+    engines = {db.engine, db.read_engine}
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        result = call()
+        if inspect.isgenerator(result):
+            list(result)
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def leading_columns(connection):
+    # índice → (tabla, primera columna, parcial); los de expresión no aparecen
+    rows = connection.exec_driver_sql(
+        "SELECT i.relname, t.relname, a.attname, x.indpred IS NOT NULL "
+        "FROM pg_index x "
+        "JOIN pg_class i ON i.oid = x.indexrelid "
+        "JOIN pg_class t ON t.oid = x.indrelid "
+        "JOIN pg_attribute a ON a.attrelid = x.indrelid AND a.attnum = x.indkey[0]"
+    )
+    return {index: (table, column, partial) for index, table, column, partial in rows}
+
+
+def index_name(line):
+    for marker in (
+        "Index Scan using ",
+        "Index Only Scan using ",
+        "Bitmap Index Scan on ",
+    ):
+        if marker in line:
+            return line.split(marker)[1].split()[0]
+    return None
+
+
+def seq_scans(statement, parameters):
+    connection = db.session.connection()
+    # SET LOCAL dura hasta el fin de la transacción y los métodos probados
+    # hacen commit o rollback: se repite antes de cada EXPLAIN.
+    # Sin datos el planificador siempre prefiere Seq Scan; así solo aparece
+    # cuando no hay un índice utilizable
+    connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+    plan = connection.exec_driver_sql(f"EXPLAIN {statement}", parameters).fetchall()
+    indexes = leading_columns(connection)
+    lines = [line for (line,) in plan]
+    scans = []
+    for number, line in enumerate(lines):
+        if "Seq Scan on " in line:
+            table = line.split("Seq Scan on ")[1].split()[0]
+            if table not in ALLOWED_SEQ_SCANS:
+                scans.append(line.strip())
+            continue
+        # Con enable_seqscan = off el Seq Scan se disfraza de recorrido completo
+        # de un índice cuya condición no usa la primera columna. Solo cuenta si
+        # ningún otro índice completo de la tabla empieza por lo que se filtra
+        name = index_name(line)
+        if name not in indexes:
+            continue
+        table, column, _ = indexes[name]
+        if table in ALLOWED_SEQ_SCANS:
+            continue
+        details = []
+        for detail in lines[number + 1 :]:
+            if "->" in detail:
+                break
+            details.append(detail)
+        cond = " ".join(detail for detail in details if "Index Cond:" in detail)
+        if not cond or column in cond:
+            continue
+        usable = {
+            other
+            for other_table, other, partial in indexes.values()
+            if other_table == table and not partial
+        }
+        if not any(other in " ".join(details) for other in usable):
+            scans.append(f"{line.strip()} sin usar {column}")
+    return scans
+
+
+def main() -> int:
+    flagged = 0
+    try:
+        for name, call in [*query_methods(), *write_paths()]:
+            for statement, parameters in capture_statements(call):
+                scans = seq_scans(statement, parameters)
+                if scans:
+                    flagged += 1
+                    logger.warning(f"{name}: {' | '.join(scans)}")
+                else:
+                    logger.info(f"{name}: OK")
+    finally:
+        db.session.rollback()
+        db.remove_session()
+
+    logger.info(f"{flagged} consultas con Seq Scan")
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+# Preparación de un despliegue: esquema, índices, particiones y webhook.
+# Se ejecuta una vez antes de arrancar los workers. Uso: python init.py [--no-webhook]
+import argparse
+import logging
+import sys
+
+from bot import bot
+from config import config
+from database import MigrationError, db
+from logging_conf import configure_logging
+
+configure_logging()
+logger = logging.getLogger("chatbot.init")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--no-webhook", action="store_true")
+    args = parser.parse_args()
+
+    try:
+        db.init_schema()
+    except MigrationError as exc:
+        logger.error(str(exc))
+        return 1
+    finally:
+        db.remove_session()
+
+    if not args.no_webhook:
+        # set_webhook reemplaza el anterior; no hace falta borrarlo antes
+        bot.set_webhook(url=config.URL_BOT)
+        logger.info(f"webhook set in {config.URL_BOT}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,61 @@
+import unicodedata
+from functools import cache
+
 from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup
 
+from config import config
+
+
+class StaticMarkup(InlineKeyboardMarkup):
+    # Teclado que ya no cambia: el JSON se genera una vez y se reutiliza en
+    # cada envío. Se comparte entre requests, así que no admite más filas
+    _json = None
+
+    def add(self, *args, **kwargs):
+        if self._json is not None:
+            raise TypeError("Teclado congelado")
+        return super().add(*args, **kwargs)
+
+    def row(self, *args):
+        if self._json is not None:
+            raise TypeError("Teclado congelado")
+        return super().row(*args)
+
+    def freeze(self):
+        self._json = super().to_json()
+        return self
+
+    def to_json(self):
+        if self._json is not None:
+            return self._json
+        return super().to_json()
+
+
+def _page_row(markup, prefix, page, total):
+    pages = -(-total // config.KEYBOARD_PAGE_SIZE)
+    buttons = []
+    if page > 0:
+        buttons.append(
+            InlineKeyboardButton("⬅️Anterior", callback_data=f"{prefix}:{page - 1}")
+        )
+    if page + 1 < pages:
+        buttons.append(
+            InlineKeyboardButton("Siguiente➡️", callback_data=f"{prefix}:{page + 1}")
+        )
+    if buttons:
+        markup.row(*buttons)
+
+
+def last_page(total):
+    return max(-(-total // config.KEYBOARD_PAGE_SIZE) - 1, 0)
+
 
+def _page(items, page):
+    start = page * config.KEYBOARD_PAGE_SIZE
+    return items[start : start + config.KEYBOARD_PAGE_SIZE]
+
+
+@cache
 def menu_markup():
     apuestas = InlineKeyboardButton("🎲Apuestas", callback_data="apuestas")
     combinadas = InlineKeyboardButton("🔀Combinadas", callback_data="combinadas")
@@ -11,30 +66,31 @@ def menu_markup():
     reglas = InlineKeyboardButton("⚖️Reglas", callback_data="reglas")
     soporte = InlineKeyboardButton("📞Soporte", url="https://t.me/Osliany")
 
-    markup = InlineKeyboardMarkup()
+    markup = StaticMarkup()
     markup.row(apuestas, combinadas)
     markup.row(movimientos, bonos)
     markup.row(grupo)
     markup.row(terminos, reglas)
     markup.row(soporte)
 
-    return markup
+    return markup.freeze()
 
 
+@cache
 def apuestas_markup():
-    beisbol = InlineKeyboardButton("⚾Béisbol", callback_data="beisbol")
-    futbol = InlineKeyboardButton("⚽Fútbol", callback_data="futbol")
-    baloncesto = InlineKeyboardButton("🏀Baloncesto", callback_data="baloncesto")
-    tenis = InlineKeyboardButton("🎾Tenis", callback_data="tenis")
-    ufc = InlineKeyboardButton("🥋UFC", callback_data="ufc")
-    boxeo = InlineKeyboardButton("🥊Boxeo", callback_data="boxeo")
+    beisbol = InlineKeyboardButton("⚾Béisbol", callback_data="sport:beisbol")
+    futbol = InlineKeyboardButton("⚽Fútbol", callback_data="sport:futbol")
+    baloncesto = InlineKeyboardButton("🏀Baloncesto", callback_data="sport:baloncesto")
+    tenis = InlineKeyboardButton("🎾Tenis", callback_data="sport:tenis")
+    ufc = InlineKeyboardButton("🥋UFC", callback_data="sport:ufc")
+    boxeo = InlineKeyboardButton("🥊Boxeo", callback_data="sport:boxeo")
     futbol_americano = InlineKeyboardButton(
-        "🏈Fútbol Americano", callback_data="futbol_americano"
+        "🏈Fútbol Americano", callback_data="sport:futbol_americano"
     )
-    balonmano = InlineKeyboardButton("🤾Balonmano", callback_data="balonmano")
+    balonmano = InlineKeyboardButton("🤾Balonmano", callback_data="sport:balonmano")
     regresar = InlineKeyboardButton("↩️Regresar", callback_data="menu")
 
-    markup = InlineKeyboardMarkup()
+    markup = StaticMarkup()
     markup.row(futbol, beisbol)
     markup.row(baloncesto, tenis)
     markup.row(ufc, boxeo)
@@ -42,9 +98,10 @@ def apuestas_markup():
     markup.row(balonmano)
     markup.row(regresar)
 
-    return markup
+    return markup.freeze()
 
 
+@cache
 def movimientos_markup():
     mi_saldo = InlineKeyboardButton("💰Mi Saldo", callback_data="mi_saldo")
     recarga = InlineKeyboardButton("💳Recarga", callback_data="recarga")
@@ -54,47 +111,147 @@ def movimientos_markup():
     )
     regresar = InlineKeyboardButton("↩️Regresar", callback_data="menu")
 
-    markup = InlineKeyboardMarkup()
+    markup = StaticMarkup()
     markup.row(mi_saldo)
     markup.row(recarga, retiros)
     markup.row(transferencia_interna)
     markup.row(regresar)
 
+    return markup.freeze()
+
+
+# Ligas del antiguo teclado fijo de fútbol: (etiqueta, slug). Sus botones
+# siguen en mensajes ya enviados y se resuelven contra competitions
+LEAGUES = [
+    ("Arabia Saudí", "arabia"),
+    ("Alemania", "alemania"),
+    ("Italia", "italia"),
+    ("Francia", "francia"),
+    ("España", "españa"),
+    ("Championship", "championship"),
+    ("Rusia", "rusia"),
+    ("Países bajos", "paises_bajos"),
+    ("Turquía", "turquia"),
+    ("Portugal", "portugal"),
+    ("Australia", "australia"),
+    ("Bélgica", "belgica"),
+    ("Rumanía", "rumania"),
+    ("México", "mexico"),
+    ("Argentina", "argentina"),
+    ("Colombia", "colombia"),
+]
+
+
+def slugify(name):
+    name = unicodedata.normalize("NFKD", name.lower())
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return "_".join(name.split())
+
+
+def competitions_markup(sport_slug, competitions, page=0):
+    buttons = [
+        InlineKeyboardButton(
+            competition["name"],
+            callback_data=f"comp:{competition['competition_id']}",
+        )
+        for competition in _page(competitions, page)
+    ]
+
+    markup = StaticMarkup()
+    for index in range(0, len(buttons), 2):
+        markup.row(*buttons[index : index + 2])
+    _page_row(markup, f"sport:{sport_slug}", page, len(competitions))
+    markup.row(InlineKeyboardButton("↩️Regresar", callback_data="apuestas"))
+
+    return markup.freeze()
+
+
+def matches_markup(competition_id, sport_slug, matches, page=0):
+    markup = StaticMarkup()
+    for match in _page(matches, page):
+        markup.row(
+            InlineKeyboardButton(
+                f"{match['team_home']} vs {match['team_away']} · {match['match_date']:%d/%m %H:%M}",
+                callback_data=f"match:{match['match_id']}",
+            )
+        )
+    _page_row(markup, f"comp:{competition_id}", page, len(matches))
+    markup.row(InlineKeyboardButton("↩️Regresar", callback_data=f"sport:{sport_slug}"))
+
+    return markup.freeze()
+
+
+def options_markup(match, options, page=0):
+    buttons = [
+        InlineKeyboardButton(
+            f"{option['prediction']} @ {option['odds']}",
+            callback_data=f"opt:{option['option_id']}",
+        )
+        for option in _page(options, page)
+    ]
+
+    markup = StaticMarkup()
+    for index in range(0, len(buttons), 2):
+        markup.row(*buttons[index : index + 2])
+    _page_row(markup, f"match:{match['match_id']}", page, len(options))
+    markup.row(
+        InlineKeyboardButton(
+            "↩️Regresar", callback_data=f"comp:{match['competition_id']}"
+        )
+    )
+
+    return markup.freeze()
+
+
+def option_markup(option):
+    markup = InlineKeyboardMarkup()
+    markup.row(
+        InlineKeyboardButton("↩️Regresar", callback_data=f"match:{option['match_id']}")
+    )
+
     return markup
 
 
-def futbol_markup():
-    arabia = InlineKeyboardButton("Arabia Saudí", callback_data="arabia")
-    alemania = InlineKeyboardButton("Alemania", callback_data="alemania")
-    italia = InlineKeyboardButton("Italia", callback_data="italia")
-    francia = InlineKeyboardButton("Francia", callback_data="francia")
-    españa = InlineKeyboardButton("España", callback_data="españa")
-    championship = InlineKeyboardButton("Championship", callback_data="championship")
-    rusia = InlineKeyboardButton("Rusia", callback_data="rusia")
-    paises_bajos = InlineKeyboardButton("Países bajos", callback_data="paises_bajos")
-    turquia = InlineKeyboardButton("Turquía", callback_data="turquia")
-    portugal = InlineKeyboardButton("Portugal", callback_data="portugal")
-    australia = InlineKeyboardButton("Australia", callback_data="australia")
-    belgica = InlineKeyboardButton("Bélgica", callback_data="belgica")
-    rumania = InlineKeyboardButton("Rumanía", callback_data="rumania")
-    mexico = InlineKeyboardButton("México", callback_data="mexico")
-    argentina = InlineKeyboardButton("Argentina", callback_data="argentina")
-    colombia = InlineKeyboardButton("Colombia", callback_data="colombia")
+def historial_markup(kind, prev_cursor, next_cursor):
+    buttons = []
+    if prev_cursor:
+        buttons.append(
+            InlineKeyboardButton(
+                "⬅️Anterior", callback_data=f"historial:{kind}:{prev_cursor}"
+            )
+        )
+    if next_cursor:
+        buttons.append(
+            InlineKeyboardButton(
+                "Siguiente➡️", callback_data=f"historial:{kind}:{next_cursor}"
+            )
+        )
+    if not buttons:
+        return None
 
     markup = InlineKeyboardMarkup()
-    markup.row(arabia, alemania)
-    markup.row(italia, francia)
-    markup.row(españa)
-    markup.row(championship, rusia)
-    markup.row(paises_bajos, turquia)
-    markup.row(portugal, australia)
-    markup.row(belgica, rumania)
-    markup.row(mexico, argentina)
-    markup.row(colombia)
+    markup.row(*buttons)
 
     return markup
 
 
+@cache
+def top_markup(window):
+    labels = {"day": "📅Hoy", "week": "🗓️Semana", "all": "🏆Histórico"}
+    buttons = [
+        InlineKeyboardButton(
+            f"·{label}·" if key == window else label, callback_data=f"top:{key}"
+        )
+        for key, label in labels.items()
+    ]
+
+    markup = StaticMarkup()
+    markup.row(*buttons)
+
+    return markup.freeze()
+
+
+@cache
 def reglas_markup():
     beisbol = InlineKeyboardButton("⚾Beisbol", callback_data="reglas_beisbol")
     futbol = InlineKeyboardButton("⚽Fútbol", callback_data="reglas_futbol")
@@ -108,7 +265,7 @@ def reglas_markup():
     balonmano = InlineKeyboardButton("🤾Balonmano", callback_data="reglas_balonmano")
     regresar = InlineKeyboardButton("↩️Regresar", callback_data="menu")
 
-    markup = InlineKeyboardMarkup()
+    markup = StaticMarkup()
     markup.row(futbol, beisbol)
     markup.row(baloncesto, tenis)
     markup.row(ufc, boxeo)
@@ -116,4 +273,9 @@ def reglas_markup():
     markup.row(balonmano)
     markup.row(regresar)
 
-    return markup
+    return markup.freeze()
+
+
+# Los teclados fijos se construyen y serializan al arrancar
+for build in (menu_markup, apuestas_markup, movimientos_markup, reglas_markup):
+    build()
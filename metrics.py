@@ -0,0 +1,49 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._timers: Dict[str, Dict[str, float]] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            timer = self._timers.setdefault(
+                name, {"count": 0, "total": 0.0, "max": 0.0}
+            )
+            timer["count"] += 1
+            timer["total"] += seconds
+            timer["max"] = max(timer["max"], seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def gauge(self, name: str, func: Callable[[], float]):
+        self._gauges[name] = func
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+            timers = {
+                name: {**timer, "avg": timer["total"] / timer["count"]}
+                for name, timer in self._timers.items()
+            }
+        gauges = {name: func() for name, func in self._gauges.items()}
+        return {"counters": counters, "timers": timers, "gauges": gauges}
+
+
+metrics = Metrics()
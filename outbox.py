@@ -0,0 +1,117 @@
+# Despachador del outbox: envía por Telegram los avisos de depósitos,
+# extracciones, transferencias y apuestas liquidadas, fuera de la transacción
+# que los generó. Entrega al menos una vez; se pueden lanzar varios en paralelo.
+# Uso: python outbox.py [--batch-size N] [--interval S] [--once]
+import argparse
+import logging
+import sys
+import time
+
+from telebot.apihelper import ApiTelegramException
+
+from bot import bot
+from config import config
+from database import db
+from logging_conf import configure_logging
+from metrics import metrics
+
+configure_logging()
+logger = logging.getLogger("chatbot.outbox")
+
+TRANSACTION_LABELS = {
+    "DEPOSIT": ("depósito", "aprobado ✅", "rechazado ❌"),
+    "WITHDRAWAL": ("extracción", "aprobada ✅", "rechazada ❌"),
+}
+
+
+def render(event) -> str:
+    payload = event["payload"]
+    kind = event["event_type"]
+    if kind in ("transaction_approved", "transaction_rejected"):
+        label, approved, rejected = TRANSACTION_LABELS[payload["type"]]
+        verdict = approved if kind == "transaction_approved" else rejected
+        return f"Tu {label} #{payload['transaction_id']} de {payload['amount']} CUP fue {verdict}"
+    if kind == "transfer_received":
+        return (
+            f"Recibiste {payload['amount']} CUP del usuario #{payload['sender_id']} 💸"
+        )
+    if kind in ("bet_settled", "parlay_settled"):
+        name = "apuesta" if kind == "bet_settled" else "combinada"
+        number = payload.get("bet_id") or payload.get("parlay_id")
+        if payload["status"] == "WIN":
+            return f"¡Tu {name} #{number} ganó! 🎉 +{payload['potential_win']} CUP"
+        return f"Tu {name} #{number} no resultó ganadora"
+    raise ValueError(f"Evento desconocido: {kind}")
+
+
+def retry_delay(event, exc: Exception):
+    # None = no reintentar: el evento queda como fallido
+    if event["attempts"] >= config.OUTBOX_MAX_ATTEMPTS:
+        return None
+    if isinstance(exc, ApiTelegramException):
+        if exc.error_code in (400, 403):
+            return None
+        if exc.error_code == 429:
+            return exc.result_json.get("parameters", {}).get("retry_after", 5)
+    return min(2 ** event["attempts"], 300)
+
+
+def dispatch(batch_size: int) -> int:
+    events = db.claim_outbox_events(limit=batch_size)
+    delivered = []
+    for event in events:
+        try:
+            text = render(event)
+        except (KeyError, ValueError) as exc:
+            # Tipo desconocido o payload incompleto: reintentar no lo arregla
+            db.retry_outbox_event(event["event_id"], f"No se pudo armar: {exc!r}")
+            metrics.incr("outbox.failed")
+            logger.error(
+                f"Aviso #{event['event_id']} ({event['event_type']}) descartado: {exc!r}"
+            )
+            continue
+        try:
+            bot.send_message(event["user_id"], text)
+            delivered.append(event["event_id"])
+        except Exception as exc:
+            delay = retry_delay(event, exc)
+            db.retry_outbox_event(event["event_id"], str(exc), delay)
+            if isinstance(exc, ApiTelegramException) and exc.error_code == 403:
+                db.mark_users_blocked([event["user_id"]])
+            metrics.incr("outbox.failed" if delay is None else "outbox.retried")
+            logger.warning(
+                f"Aviso #{event['event_id']} ({event['event_type']}) sin entregar: {exc}"
+            )
+    db.ack_outbox_events(delivered)
+    metrics.incr("outbox.sent", len(delivered))
+    if events:
+        logger.info(f"{len(delivered)}/{len(events)} avisos entregados")
+    return len(events)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch-size", type=int, default=config.OUTBOX_BATCH_SIZE)
+    parser.add_argument("--interval", type=float, default=config.OUTBOX_POLL_INTERVAL)
+    parser.add_argument("--once", action="store_true")
+    args = parser.parse_args()
+
+    db.check_schema()
+    try:
+        while True:
+            try:
+                claimed = dispatch(args.batch_size)
+            finally:
+                db.remove_session()
+            if args.once and claimed < args.batch_size:
+                break
+            # Lote lleno: probablemente queda más, se sigue sin esperar
+            if claimed < args.batch_size:
+                time.sleep(args.interval)
+    except KeyboardInterrupt:
+        logger.info("Despachador detenido")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
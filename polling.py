@@ -5,7 +5,7 @@ from bot import bot
 from database import db
 from logging_conf import configure_logging
 from markups import menu_markup
-from utils import process_inline_button, send_message
+from utils import process_inline_button, send_leaderboard, send_message
 
 configure_logging()
 logger = logging.getLogger("chatbot.polling")
@@ -26,6 +26,9 @@ def cmd_start(message):
             "last_name": message.from_user.last_name,
         }
         db.create_user(data)
+    elif user["bot_blocked_at"]:
+        # Volvió a abrir el chat: de nuevo recibe difusiones
+        db.update_user(message.from_user.id, {"bot_blocked_at": None})
 
     msg = f"¡Hola {message.from_user.first_name}! 👋" + welcome_msg
     send_message(message, msg, menu_markup())
@@ -71,9 +74,7 @@ def cmd_recargar(message):
 @bot.message_handler(commands=["top"])
 def cmd_top(message):
     logger.info("/top")
-    send_message(
-        message, "Hola, bienvenido al mejor bot de apuestas deportivas de Cuba!"
-    )
+    send_leaderboard(message)
 
 
 @bot.message_handler(commands=["misreferidos"])
@@ -92,6 +93,7 @@ def reply_text(message):
 
 if __name__ == "__main__":
     db.connect()
+    db.check_schema()
     bot.remove_webhook()
     logger.info("Polling started...")
     bot.polling()
@@ -0,0 +1,34 @@
+# Concilia users.balance contra el libro de transacciones.
+# Uso: python reconcile.py [--no-snapshot] [--chunk-size N] [--lag S]
+import argparse
+import logging
+import sys
+
+from database import db
+from logging_conf import configure_logging
+
+configure_logging()
+logger = logging.getLogger("chatbot.reconcile")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--no-snapshot", action="store_true")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--lag", type=int, default=300)
+    args = parser.parse_args()
+
+    try:
+        report = db.reconcile_balances(
+            chunk_size=args.chunk_size,
+            snapshot=not args.no_snapshot,
+            lag_seconds=args.lag,
+        )
+    finally:
+        db.remove_session()
+
+    return 1 if report["mismatches"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import logging
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from database import decode_cursor
+from metrics import metrics
+
+logger = logging.getLogger("chatbot.router")
+
+
+def cursor(value: str) -> Optional[str]:
+    # Vacío = primera página; uno malformado o manipulado no llega al handler
+    if value:
+        decode_cursor(value)
+    return value or None
+
+
+def page(value: str) -> int:
+    # Vacío = primera página
+    number = int(value) if value else 0
+    if number < 0:
+        raise ValueError(f"Página inválida: {value}")
+    return number
+
+
+class Route(NamedTuple):
+    prefix: str
+    handler: Callable
+    params: Tuple[Callable, ...]
+
+
+class Router:
+    # callback_data = "prefijo:param1:param2..."; cada parámetro pasa por su
+    # conversor (int, str, cursor, un Enum...). Los que faltan llegan como ""
+    def __init__(self):
+        self.routes: Dict[str, Route] = {}
+        self.aliases: Dict[str, str] = {}
+        self.fallback: Optional[Callable] = None
+
+    def route(self, prefix: str, *params: Callable):
+        def register(handler):
+            if prefix in self.routes:
+                raise ValueError(f"Ruta duplicada: {prefix}")
+            self.routes[prefix] = Route(prefix, handler, params)
+            return handler
+
+        return register
+
+    def alias(self, data: str, target: str):
+        # callback_data antiguos que siguen en mensajes ya enviados
+        self.aliases[data] = target
+
+    def not_found(self, handler):
+        self.fallback = handler
+        return handler
+
+    def resolve(self, data: str):
+        data = self.aliases.get(data, data)
+        prefix, _, rest = data.partition(":")
+        route = self.routes.get(prefix)
+        if route is None:
+            return None, ()
+        if not route.params:
+            return (route, ()) if not rest else (None, ())
+
+        values = rest.split(":", len(route.params) - 1)
+        if len(values) < len(route.params):
+            values += [""] * (len(route.params) - len(values))
+        try:
+            args = tuple(convert(value) for convert, value in zip(route.params, values))
+        except ValueError:
+            return None, ()
+        return route, args
+
+    def dispatch(self, data: str, obj_msg):
+        route, args = self.resolve(data)
+        if route is None:
+            metrics.incr("router.not_found")
+            logger.error(f"Botón {data} no registrado")
+            if self.fallback:
+                self.fallback(obj_msg, data)
+            return
+
+        name = f"router.{route.prefix}"
+        try:
+            with metrics.timer(name):
+                route.handler(obj_msg, *args)
+        except Exception:
+            metrics.incr(f"{name}.errors")
+            raise
+
+
+router = Router()
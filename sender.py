@@ -0,0 +1,173 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from telebot import apihelper
+
+from config import config
+from metrics import metrics
+
+logger = logging.getLogger("chatbot.sender")
+
+# Métodos que no cuentan como mensaje para los límites de Telegram
+UNTHROTTLED = {"getMe", "getFile", "getUpdates", "setWebhook", "deleteWebhook"}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        # Toma un token y devuelve cuánto hay que esperar para usarlo
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            return max(-self.tokens / self.rate, 0.0)
+
+    def delay(self, seconds: float):
+        # Telegram pidió retry_after: nadie usa este cubo hasta entonces
+        with self._lock:
+            self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class TelegramSender:
+    # Todas las llamadas del bot pasan por aquí: una sesión HTTP con conexiones
+    # persistentes, límite global y por chat y reintento tras un 429
+    def __init__(self):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=config.TELEGRAM_POOL_SIZE
+        )
+        self.session.mount("https://", adapter)
+        # El límite de Telegram es por bot: cada proceso se queda con su parte
+        rate = config.TELEGRAM_GLOBAL_RATE / max(config.TELEGRAM_PROCESSES, 1)
+        self.global_bucket = TokenBucket(rate, rate)
+        self._chats = OrderedDict()
+        self._lock = threading.Lock()
+        self._typing_at = {}
+        # "escribiendo..." pendientes: (vence, orden, chat_id, cancelado)
+        self._typing_due = []
+        self._typing_order = itertools.count()
+        self._typing_ready = threading.Condition(self._lock)
+        self._typing_thread = None
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        with self._lock:
+            bucket = self._chats.pop(chat_id, None) or TokenBucket(
+                config.TELEGRAM_CHAT_RATE, config.TELEGRAM_CHAT_BURST
+            )
+            self._chats[chat_id] = bucket
+            if len(self._chats) > config.TELEGRAM_MAX_TRACKED_CHATS:
+                self._chats.popitem(last=False)
+            return bucket
+
+    def _throttle(self, buckets):
+        wait = max(bucket.reserve() for bucket in buckets)
+        if wait:
+            metrics.observe("telegram.throttle_wait", wait)
+            time.sleep(wait)
+
+    def request(self, method, url, params=None, files=None, **kwargs):
+        method_name = url.rsplit("/", 1)[-1]
+        chat_id = (params or {}).get("chat_id")
+        buckets = []
+        if method_name not in UNTHROTTLED:
+            buckets.append(self.global_bucket)
+            # "escribiendo..." no es un mensaje: no gasta el cupo del chat
+            if chat_id is not None and method_name != "sendChatAction":
+                buckets.append(self._chat_bucket(chat_id))
+
+        for _ in range(config.TELEGRAM_MAX_RETRIES + 1):
+            self._throttle(buckets)
+            with metrics.timer("telegram.send"):
+                response = self.session.request(
+                    method, url, params=params, files=files, **kwargs
+                )
+            metrics.incr("telegram.requests")
+            if response.status_code != 429:
+                return response
+
+            metrics.incr("telegram.429")
+            retry_after = response.json().get("parameters", {}).get("retry_after", 1)
+            logger.warning(
+                f"429 en {method_name} (chat {chat_id}), reintento en {retry_after}s"
+            )
+            # Los archivos ya se leyeron y "escribiendo..." caduca: no se reintentan
+            if files or method_name == "sendChatAction":
+                break
+            # El más específico: un 429 de un chat no frena a los demás
+            if buckets:
+                buckets[-1].delay(retry_after)
+        return response
+
+    def send_typing(self, chat_id):
+        # El indicador dura ~5s en Telegram: no se repite antes por chat
+        now = time.monotonic()
+        with self._lock:
+            last = self._typing_at.get(chat_id, 0)
+            if now - last < config.TELEGRAM_TYPING_INTERVAL:
+                metrics.incr("telegram.typing_coalesced")
+                return
+            if len(self._typing_at) > config.TELEGRAM_MAX_TRACKED_CHATS:
+                self._typing_at.clear()
+            self._typing_at[chat_id] = now
+        try:
+            apihelper.send_chat_action(config.TELEGRAM_TOKEN, chat_id, "typing")
+        except Exception as exc:
+            logger.debug(f"No se pudo enviar typing a {chat_id}: {exc}")
+
+    def _typing_loop(self):
+        # Un solo hilo para todos los chats en vez de un Timer por update
+        while True:
+            with self._typing_ready:
+                while True:
+                    wait = None
+                    if self._typing_due:
+                        wait = self._typing_due[0][0] - time.monotonic()
+                        if wait <= 0:
+                            break
+                    self._typing_ready.wait(wait)
+                _, _, chat_id, cancelled = heapq.heappop(self._typing_due)
+            if not cancelled:
+                self.send_typing(chat_id)
+
+    @contextmanager
+    def typing(self, chat_id):
+        # Solo si la respuesta tarda: una respuesta inmediata no lo necesita
+        entry = [
+            time.monotonic() + config.TELEGRAM_TYPING_DELAY,
+            next(self._typing_order),
+            chat_id,
+            False,
+        ]
+        with self._typing_ready:
+            if self._typing_thread is None:
+                # Perezoso: el hilo nace en el worker ya forkeado, no en el master
+                self._typing_thread = threading.Thread(
+                    target=self._typing_loop, name="typing", daemon=True
+                )
+                self._typing_thread.start()
+            heapq.heappush(self._typing_due, entry)
+            self._typing_ready.notify()
+        try:
+            yield
+        finally:
+            with self._lock:
+                entry[3] = True
+
+
+sender = TelegramSender()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Los módulos viven en la raíz del repo; database.py crea su engine al
+# importarse (sin conectar), así que basta con una URL cualquiera
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg2://localhost/test")
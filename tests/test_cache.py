@@ -0,0 +1,70 @@
+from cache import TTLCache
+
+
+def make_cache(maxsize=10, ttl=60):
+    return TTLCache("test", maxsize, ttl)
+
+
+def test_get_or_load_calls_loader_once():
+    cache = make_cache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return "valor"
+
+    assert cache.get_or_load(("sports",), loader) == "valor"
+    assert cache.get_or_load(("sports",), loader) == "valor"
+    assert len(calls) == 1
+
+
+def test_expired_entry_is_reloaded():
+    cache = make_cache(ttl=-1)
+    values = iter(["viejo", "nuevo"])
+    assert cache.get_or_load(("sports",), lambda: next(values)) == "viejo"
+    assert cache.get_or_load(("sports",), lambda: next(values)) == "nuevo"
+
+
+def test_invalidate_by_prefix_keeps_other_keys():
+    cache = make_cache()
+    for key in [
+        ("bet_options", 1, True),
+        ("bet_options", 1, False),
+        ("bet_options", 2, True),
+        ("matches", 1),
+    ]:
+        cache.get_or_load(key, lambda: "x")
+
+    cache.invalidate("bet_options", 1)
+
+    assert set(cache._data) == {("bet_options", 2, True), ("matches", 1)}
+
+
+def test_invalidate_namespace_drops_all_its_keys():
+    cache = make_cache()
+    for key in [("matches", 1), ("matches", 2, "markup", 0), ("sports",)]:
+        cache.get_or_load(key, lambda: "x")
+
+    cache.invalidate("matches")
+
+    assert set(cache._data) == {("sports",)}
+
+
+def test_prefix_does_not_match_longer_ident():
+    # ("matches", 1) no debe tirar ("matches", 12)
+    cache = make_cache()
+    cache.get_or_load(("matches", 12), lambda: "x")
+
+    cache.invalidate("matches", 1)
+
+    assert ("matches", 12) in cache._data
+
+
+def test_lru_eviction_respects_maxsize():
+    cache = make_cache(maxsize=2)
+    cache.get_or_load(("a",), lambda: 1)
+    cache.get_or_load(("b",), lambda: 2)
+    cache.get_or_load(("a",), lambda: 1)  # "a" pasa a ser la más reciente
+    cache.get_or_load(("c",), lambda: 3)
+
+    assert set(cache._data) == {("a",), ("c",)}
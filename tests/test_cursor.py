@@ -0,0 +1,42 @@
+from datetime import datetime
+
+import pytest
+
+from database import decode_cursor, encode_cursor
+from router import cursor
+
+
+@pytest.mark.parametrize(
+    "created_at, row_id",
+    [
+        (datetime(2024, 5, 17, 13, 45, 2, 123456), 1),
+        (datetime(1970, 1, 1), 0),
+        (datetime(2099, 12, 31, 23, 59, 59, 999999), 2**40),
+    ],
+)
+@pytest.mark.parametrize("direction", ["n", "p"])
+def test_round_trip(direction, created_at, row_id):
+    encoded = encode_cursor(direction, created_at, row_id)
+    assert decode_cursor(encoded) == (direction, created_at, row_id)
+
+
+def test_fits_in_callback_data():
+    encoded = encode_cursor("n", datetime(2099, 12, 31, 23, 59, 59, 999999), 2**31)
+    assert len(f"historial:activas:{encoded}".encode()) <= 64
+
+
+@pytest.mark.parametrize(
+    "value",
+    ["x", "n", "n12", "n1.2.3", "zab.1", "nzz.1", "n1.zz", "n" + "f" * 40 + ".1"],
+)
+def test_malformed_cursor_raises_value_error(value):
+    with pytest.raises(ValueError):
+        decode_cursor(value)
+
+
+def test_router_converter():
+    encoded = encode_cursor("p", datetime(2024, 1, 1), 7)
+    assert cursor(encoded) == encoded
+    assert cursor("") is None
+    with pytest.raises(ValueError):
+        cursor("n1.2.3")
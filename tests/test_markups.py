@@ -0,0 +1,85 @@
+import json
+
+import pytest
+from telebot.types import InlineKeyboardButton
+
+import markups
+from config import config
+from markups import StaticMarkup
+
+
+def button(label):
+    return InlineKeyboardButton(label, callback_data=label)
+
+
+def test_freeze_serializes_once():
+    markup = StaticMarkup()
+    markup.row(button("a"), button("b"))
+    frozen = markup.freeze()
+
+    assert frozen is markup
+    assert markup.to_json() is markup.to_json()
+    assert json.loads(markup.to_json())["inline_keyboard"][0][1]["text"] == "b"
+
+
+@pytest.mark.parametrize("method", ["add", "row"])
+def test_frozen_markup_rejects_new_rows(method):
+    markup = StaticMarkup().freeze()
+    with pytest.raises(TypeError):
+        getattr(markup, method)(button("a"))
+
+
+def test_unfrozen_markup_still_changes():
+    markup = StaticMarkup()
+    markup.row(button("a"))
+    first = markup.to_json()
+    markup.row(button("b"))
+    assert markup.to_json() != first
+
+
+def test_shared_markups_are_frozen():
+    assert markups.menu_markup() is markups.menu_markup()
+    with pytest.raises(TypeError):
+        markups.menu_markup().row(button("a"))
+
+
+@pytest.mark.parametrize(
+    "total, expected",
+    [
+        (0, 0),
+        (1, 0),
+        (config.KEYBOARD_PAGE_SIZE, 0),
+        (config.KEYBOARD_PAGE_SIZE + 1, 1),
+    ],
+)
+def test_last_page(total, expected):
+    assert markups.last_page(total) == expected
+
+
+def test_competitions_markup_pages():
+    competitions = [
+        {"competition_id": index, "name": f"Liga {index}"}
+        for index in range(config.KEYBOARD_PAGE_SIZE + 1)
+    ]
+    keyboard = json.loads(
+        markups.competitions_markup("futbol", competitions, 1).to_json()
+    )["inline_keyboard"]
+
+    assert keyboard[0][0]["callback_data"] == f"comp:{config.KEYBOARD_PAGE_SIZE}"
+    assert [b["callback_data"] for b in keyboard[1]] == ["sport:futbol:0"]
+    assert keyboard[-1][0]["callback_data"] == "apuestas"
+
+
+def test_options_markup_pages():
+    match = {"match_id": 9, "competition_id": 4}
+    options = [
+        {"option_id": index, "prediction": f"Opción {index}", "odds": 2}
+        for index in range(config.KEYBOARD_PAGE_SIZE + 1)
+    ]
+    keyboard = json.loads(markups.options_markup(match, options, 1).to_json())[
+        "inline_keyboard"
+    ]
+
+    assert keyboard[0][0]["callback_data"] == f"opt:{config.KEYBOARD_PAGE_SIZE}"
+    assert [b["callback_data"] for b in keyboard[1]] == ["match:9:0"]
+    assert keyboard[-1][0]["callback_data"] == "comp:4"
@@ -0,0 +1,94 @@
+from datetime import datetime
+
+import pytest
+
+from database import StatsWindow, encode_cursor
+from router import Router, cursor, page
+
+
+@pytest.fixture
+def router():
+    router = Router()
+
+    @router.route("menu")
+    def menu(obj_msg):
+        return "menu"
+
+    @router.route("comp", int, page)
+    def competition(obj_msg, competition_id, page_number):
+        return competition_id, page_number
+
+    @router.route("top", StatsWindow)
+    def top(obj_msg, window):
+        return window
+
+    @router.route("historial", str, cursor)
+    def history(obj_msg, kind, page_cursor):
+        return kind, page_cursor
+
+    router.alias("futbol", "comp:7")
+    return router
+
+
+def handle(router, data):
+    route, args = router.resolve(data)
+    return route and route.handler(None, *args)
+
+
+def test_route_without_params(router):
+    assert handle(router, "menu") == "menu"
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        ("comp:7", (7, 0)),
+        ("comp:7:2", (7, 2)),
+        ("comp:7:", (7, 0)),
+        ("top:week", StatsWindow.WEEK),
+        ("historial:activas", ("activas", None)),
+        ("futbol", (7, 0)),
+    ],
+)
+def test_resolve_converts_params(router, data, expected):
+    assert handle(router, data) == expected
+
+
+def test_resolve_passes_valid_cursor(router):
+    encoded = encode_cursor("n", datetime(2024, 1, 1), 3)
+    assert handle(router, f"historial:pasadas:{encoded}") == ("pasadas", encoded)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        "desconocido",
+        "menu:extra",
+        "comp:abc",
+        "comp:7:-1",
+        "comp:7:x",
+        "top:year",
+        "historial:activas:n1.2.3",
+    ],
+)
+def test_resolve_rejects_bad_data(router, data):
+    assert router.resolve(data) == (None, ())
+
+
+def test_duplicate_route_raises(router):
+    with pytest.raises(ValueError):
+        router.route("menu")(lambda obj_msg: None)
+
+
+def test_dispatch_calls_fallback_for_unknown_data(router):
+    seen = []
+    router.not_found(lambda obj_msg, data: seen.append(data))
+    router.dispatch("comp:abc", None)
+    assert seen == ["comp:abc"]
+
+
+def test_page_converter():
+    assert page("") == 0
+    assert page("3") == 3
+    with pytest.raises(ValueError):
+        page("-1")
@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+import sender as sender_module
+from config import config
+from sender import TelegramSender, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(sender_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+class FakeResponse:
+    status_code = 200
+
+
+def test_bucket_allows_burst_up_to_capacity(clock):
+    bucket = TokenBucket(rate=1, capacity=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.reserve() == pytest.approx(1.0)
+    assert bucket.reserve() == pytest.approx(2.0)
+
+
+def test_bucket_refills_over_time_without_passing_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=2)
+    bucket.reserve()
+    bucket.reserve()
+    clock[0] += 0.5
+    assert bucket.reserve() == 0.0
+    clock[0] += 60
+    assert bucket.reserve() == 0.0
+    assert bucket.tokens == pytest.approx(1.0)
+
+
+def test_bucket_delay_blocks_until_retry_after(clock):
+    bucket = TokenBucket(rate=1, capacity=3)
+    bucket.delay(5)
+    assert bucket.reserve() == pytest.approx(5.0)
+
+
+def test_chat_action_skips_chat_bucket(monkeypatch):
+    sender = TelegramSender()
+    sent = []
+    monkeypatch.setattr(
+        sender.session, "request", lambda *args, **kwargs: FakeResponse()
+    )
+    monkeypatch.setattr(sender, "_throttle", lambda buckets: sent.append(buckets))
+
+    sender.request("post", "https://x/sendChatAction", params={"chat_id": 1})
+    sender.request("post", "https://x/sendMessage", params={"chat_id": 1})
+
+    assert sent[0] == [sender.global_bucket]
+    assert sent[1] == [sender.global_bucket, sender._chats[1]]
+
+
+def test_typing_only_for_slow_responses(monkeypatch):
+    monkeypatch.setattr(config, "TELEGRAM_TYPING_DELAY", 0.05)
+    sender = TelegramSender()
+    typed = threading.Event()
+    chats = []
+
+    def send_typing(chat_id):
+        chats.append(chat_id)
+        typed.set()
+
+    monkeypatch.setattr(sender, "send_typing", send_typing)
+
+    with sender.typing(1):
+        pass
+    with sender.typing(2):
+        assert typed.wait(2)
+
+    assert chats == [2]
+    assert sender._typing_thread is not None
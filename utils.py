@@ -1,21 +1,36 @@
 import logging
+from datetime import datetime
 
 from telebot.types import ReplyKeyboardRemove
 
 import markups as markups
 from bot import bot
-from database import db
+from database import BetStatus, StatsWindow, db
+from router import cursor, page, router
 
 logger = logging.getLogger("chatbot.utils")
 
-
+BET_HISTORY = {
+    "activas": ("Apuestas activas", [BetStatus.PENDING]),
+    "pasadas": (
+        "Apuestas pasadas",
+        [BetStatus.WIN, BetStatus.LOSE, BetStatus.CANCEL],
+    ),
+}
+BET_STATUS_LABELS = {
+    BetStatus.PENDING: "⏳Pendiente",
+    BetStatus.WIN: "✅Ganada",
+    BetStatus.LOSE: "❌Perdida",
+    BetStatus.CANCEL: "🚫Cancelada",
+}
+
+
+# El "escribiendo..." lo pone el dispatcher solo si la respuesta tarda
 def send_message(obj_msg, msg, markup=ReplyKeyboardRemove()):
-    bot.send_chat_action(obj_msg.chat.id, "typing")
     bot.send_message(obj_msg.chat.id, msg, reply_markup=markup)
 
 
 def edit_message(obj_msg, msg, markup=None):
-    bot.send_chat_action(obj_msg.chat.id, "typing")
     if markup:
         bot.edit_message_text(
             msg, obj_msg.chat.id, obj_msg.message_id, reply_markup=markup
@@ -28,99 +43,268 @@ def delete_message(obj_msg):
     bot.delete_message(obj_msg.chat.id, obj_msg.message_id)
 
 
-def process_inline_button(buttom_name, obj_msg):
-    logger.info(buttom_name)
-    if buttom_name == "apuestas":
-        markup = markups.apuestas_markup()
-        msg = "Seleccione el deporte"
+def send_bets_page(obj_msg, user_id, kind, cursor=None, edit=False):
+    title, statuses = BET_HISTORY[kind]
+    page = db.get_user_bets(user_id, statuses, cursor=cursor)
+    lines = [
+        f"#{bet['bet_id']} {BET_STATUS_LABELS[bet['status']]} · {bet['amount']} CUP → {bet['potential_win']} CUP"
+        for bet in page.items
+    ]
+    msg = f"{title}:\n" + ("\n".join(lines) if lines else "No tiene apuestas")
+    markup = markups.historial_markup(kind, page.prev_cursor, page.next_cursor)
+    if edit:
         edit_message(obj_msg, msg, markup)
+    else:
+        send_message(obj_msg, msg, markup)
+
 
-    elif buttom_name == "apostar":
-        markup = markups.apuestas_markup()
-        msg = "Seleccione el deporte"
+def send_parlays_page(obj_msg, user_id, cursor=None, edit=False):
+    page = db.get_user_parlays(user_id, cursor=cursor)
+    lines = [
+        f"#{parlay['parlay_id']} {BET_STATUS_LABELS[parlay['status']]} · {parlay['legs_count']} selecciones @ {parlay['combined_odds']} · {parlay['amount']} CUP → {parlay['potential_win']} CUP"
+        for parlay in page.items
+    ]
+    msg = "🔀Combinadas:\n" + ("\n".join(lines) if lines else "No tiene combinadas")
+    markup = markups.historial_markup("combinadas", page.prev_cursor, page.next_cursor)
+    if edit:
+        edit_message(obj_msg, msg, markup)
+    else:
         send_message(obj_msg, msg, markup)
 
-    elif buttom_name == "movimientos":
-        markup = markups.movimientos_markup()
-        msg = "Seleccione una opción"
+
+def send_leaderboard(obj_msg, window=StatsWindow.ALL, edit=False):
+    leaders = db.get_leaderboard(window)
+    lines = [
+        f"{position}. {leader['username'] or leader['first_name']} · {leader['net_profit']} CUP · {leader['win_count']} ganadas"
+        for position, leader in enumerate(leaders, start=1)
+    ]
+    msg = "🏆Top apostadores\n" + (
+        "\n".join(lines) if lines else "Sin apuestas todavía"
+    )
+    markup = markups.top_markup(window.value)
+    if edit:
         edit_message(obj_msg, msg, markup)
+    else:
+        send_message(obj_msg, msg, markup)
 
-    elif buttom_name == "combinadas":
-        msg = "🛠️En desarrollo"
-        send_message(obj_msg, msg)
 
-    elif buttom_name == "bonos":
-        msg = "🛠️En desarrollo"
-        send_message(obj_msg, msg)
+def find_sport(slug):
+    for sport in db.get_all_active_sports():
+        if markups.slugify(sport["name"]) == slug:
+            return sport
+    return None
 
-    elif buttom_name == "terminos":
-        msg = msg_terminos
-        send_message(obj_msg, msg)
 
-    elif buttom_name == "reglas":
-        markup = markups.reglas_markup()
-        msg = "Selecciona un deporte para ver sus reglas"
-        edit_message(obj_msg, msg, markup)
+def sport_slug(sport_id):
+    for sport in db.get_all_active_sports():
+        if sport["sport_id"] == sport_id:
+            return markups.slugify(sport["name"])
+    return ""
 
-    elif buttom_name == "futbol":
-        markup = markups.futbol_markup()
-        msg = "Seleccione la competición"
-        edit_message(obj_msg, msg, markup)
 
-    elif buttom_name == "beisbol":
-        msg = "🛠️En desarrollo"
-        send_message(obj_msg, msg)
+def find_competition(slug):
+    # Slug de las ligas antiguas → competición por nombre o país
+    labels = {slug: label for label, slug in markups.LEAGUES}
+    key = markups.slugify(labels.get(slug, slug))
+    for sport in db.get_all_active_sports():
+        for competition in db.get_competitions_by_sport(sport["sport_id"]):
+            names = (competition["name"], competition["country"] or "")
+            if competition["is_active"] and key in map(markups.slugify, names):
+                return competition
+    return None
 
-    elif buttom_name == "baloncesto":
-        msg = "🛠️En desarrollo"
-        send_message(obj_msg, msg)
 
-    elif buttom_name == "tenis":
-        msg = "🛠️En desarrollo"
-        send_message(obj_msg, msg)
+def process_inline_button(buttom_name, obj_msg):
+    logger.info(buttom_name)
+    router.dispatch(buttom_name, obj_msg)
 
-    elif buttom_name == "ufc":
-        msg = "🛠️En desarrollo"
-        send_message(obj_msg, msg)
 
-    elif buttom_name == "boxeo":
-        msg = "🛠️En desarrollo"
-        send_message(obj_msg, msg)
+@router.not_found
+def invalid_button(obj_msg, data):
+    msg = "Botón Inválido"
+    send_message(obj_msg, msg)
 
-    elif buttom_name == "futbol_americano":
-        msg = "🛠️En desarrollo"
-        send_message(obj_msg, msg)
 
-    elif buttom_name == "balonmano":
-        msg = "🛠️En desarrollo"
-        send_message(obj_msg, msg)
+@router.route("apuestas")
+def show_sports(obj_msg):
+    markup = markups.apuestas_markup()
+    msg = "Seleccione el deporte"
+    edit_message(obj_msg, msg, markup)
 
-    elif buttom_name == "mi_saldo":
-        msg = "🛠️En desarrollo"
-        #saldo = db.get_user()
-        send_message(obj_msg, msg)
 
-    elif buttom_name == "recarga":
-        msg = "🛠️En desarrollo"
-        send_message(obj_msg, msg)
+@router.route("apostar")
+def start_betting(obj_msg):
+    markup = markups.apuestas_markup()
+    msg = "Seleccione el deporte"
+    send_message(obj_msg, msg, markup)
 
-    elif buttom_name == "retiros":
-        msg = "🛠️En desarrollo"
-        send_message(obj_msg, msg)
 
-    elif buttom_name == "transferencia":
-        msg = "🛠️En desarrollo"
-        send_message(obj_msg, msg)
+@router.route("movimientos")
+def show_movements(obj_msg):
+    markup = markups.movimientos_markup()
+    msg = "Seleccione una opción"
+    edit_message(obj_msg, msg, markup)
 
-    elif buttom_name == "menu":
-        markup = markups.menu_markup()
-        msg = "Menú Principal"
-        edit_message(obj_msg, msg, markup)
 
+@router.route("combinadas")
+def show_parlays(obj_msg):
+    send_parlays_page(obj_msg, obj_msg.chat.id)
+
+
+@router.route("terminos")
+def show_terms(obj_msg):
+    msg = msg_terminos
+    send_message(obj_msg, msg)
+
+
+@router.route("reglas")
+def show_rules(obj_msg):
+    markup = markups.reglas_markup()
+    msg = "Selecciona un deporte para ver sus reglas"
+    edit_message(obj_msg, msg, markup)
+
+
+@router.route("bonos")
+@router.route("recarga")
+@router.route("retiros")
+@router.route("transferencia")
+def in_development(obj_msg):
+    msg = "🛠️En desarrollo"
+    send_message(obj_msg, msg)
+
+
+@router.route("mi_saldo")
+def show_balance(obj_msg):
+    msg = "🛠️En desarrollo"
+    # saldo = db.get_user()
+    send_message(obj_msg, msg)
+
+
+@router.route("menu")
+def show_menu(obj_msg):
+    markup = markups.menu_markup()
+    msg = "Menú Principal"
+    edit_message(obj_msg, msg, markup)
+
+
+@router.route("historial", str, cursor)
+def show_history(obj_msg, kind, page_cursor):
+    if kind == "combinadas":
+        send_parlays_page(obj_msg, obj_msg.chat.id, page_cursor, edit=True)
     else:
-        logger.error(f"Botón {buttom_name} no registrado")
-        msg = "Botón Inválido"
+        send_bets_page(obj_msg, obj_msg.chat.id, kind, page_cursor, edit=True)
+
+
+@router.route("top", StatsWindow)
+def show_top(obj_msg, window):
+    send_leaderboard(obj_msg, window, edit=True)
+
+
+@router.route("league", str)
+def show_league(obj_msg, slug):
+    competition = find_competition(slug)
+    if not competition:
+        msg = "No hay partidos disponibles en esta competición"
+        send_message(obj_msg, msg)
+        return
+    show_competition(obj_msg, competition["competition_id"])
+
+
+@router.route("sport", str, page)
+def show_sport(obj_msg, slug, page_number):
+    sport = find_sport(slug)
+    competitions = sport and sorted(
+        (
+            competition
+            for competition in db.get_competitions_by_sport(sport["sport_id"])
+            if competition["is_active"]
+        ),
+        key=lambda competition: competition["name"],
+    )
+    if not competitions:
+        msg = "🛠️En desarrollo"
+        send_message(obj_msg, msg)
+        return
+    # Un botón viejo puede apuntar a una página que ya no existe
+    page_number = min(page_number, markups.last_page(len(competitions)))
+
+    # Teclados del catálogo bajo el namespace de sus datos: caen con ellos
+    markup = db.cached(
+        ("competitions", sport["sport_id"], "markup", page_number),
+        lambda: markups.competitions_markup(slug, competitions, page_number),
+    )
+    msg = "Seleccione la competición"
+    edit_message(obj_msg, msg, markup)
+
+
+@router.route("comp", int, page)
+def show_competition(obj_msg, competition_id, page_number=0):
+    competition = db.get_competition(competition_id)
+    matches = competition and db.get_open_matches(competition_id)
+    if not matches:
+        msg = "No hay partidos disponibles en esta competición"
+        send_message(obj_msg, msg)
+        return
+    page_number = min(page_number, markups.last_page(len(matches)))
+
+    def build():
+        slug = sport_slug(competition["sport_id"])
+        return markups.matches_markup(competition_id, slug, matches, page_number)
+
+    markup = db.cached(("matches", competition_id, "markup", page_number), build)
+    msg = f"{competition['name']}: seleccione el partido"
+    edit_message(obj_msg, msg, markup)
+
+
+@router.route("match", int, page)
+def show_match(obj_msg, match_id, page_number=0):
+    match = db.get_match(match_id)
+    # Ya empezado aunque nadie haya cargado su resultado todavía
+    if (
+        not match
+        or match["status"] != "pending"
+        or match["match_date"] <= datetime.now()
+    ):
+        msg = "El partido ya no está disponible"
+        send_message(obj_msg, msg)
+        return
+    options = db.get_bet_options_for_match(match_id)
+    page_number = min(page_number, markups.last_page(len(options)))
+    markup = db.cached(
+        ("bet_options", match_id, "markup", page_number),
+        lambda: markups.options_markup(match, options, page_number),
+    )
+    msg = f"⚽{match['team_home']} vs {match['team_away']}\n📅{match['match_date']:%d/%m %H:%M}\nSeleccione su pronóstico"
+    edit_message(obj_msg, msg, markup)
+
+
+@router.route("opt", int)
+def show_option(obj_msg, option_id):
+    option = db.get_bet_option(option_id)
+    match = option and db.get_match(option["match_id"])
+    if not match or not option["is_active"]:
+        msg = "Esta opción ya no está disponible"
         send_message(obj_msg, msg)
+        return
+    markup = markups.option_markup(option)
+    msg = f"⚽{match['team_home']} vs {match['team_away']}\nPronóstico: {option['prediction']} @ {option['odds']}\n🛠️Apostar desde aquí está en desarrollo"
+    edit_message(obj_msg, msg, markup)
+
+
+# Los botones antiguos de deportes y ligas siguen en mensajes ya enviados
+for slug in (
+    "futbol",
+    "beisbol",
+    "baloncesto",
+    "tenis",
+    "ufc",
+    "boxeo",
+    "futbol_americano",
+    "balonmano",
+):
+    router.alias(slug, f"sport:{slug}")
+for _, slug in markups.LEAGUES:
+    router.alias(slug, f"league:{slug}")
 
 
 msg_terminos = """‼️Por razones obvias, este bot de apuestas deportivas cuenta con sus propios reglamentos cuya lectura es importante antes de realizar cualquier apuesta⚠️